@@ -26,13 +26,12 @@ import hedy
 import hedy_content
 import hedy_translation
 import hedyweb
+import program_runner
 import utils
 from safe_format import safe_format
 from config import config
 from flask_helpers import render_template
-from hedy_content import (ADVENTURE_ORDER_PER_LEVEL, ALL_KEYWORD_LANGUAGES,
-                          ALL_LANGUAGES, COUNTRIES,
-                          NON_LATIN_LANGUAGES)
+from hedy_content import ALL_KEYWORD_LANGUAGES, ALL_LANGUAGES, COUNTRIES
 from logging_config import LOGGING_CONFIG
 from utils import dump_yaml_rt, is_debug_mode, load_yaml_rt, timems, version, strip_accents
 from website import (ab_proxying, achievements, admin, auth_pages, aws_helpers,
@@ -63,29 +62,12 @@ app = Flask(__name__, static_url_path='')
 app.url_map.strict_slashes = False  # Ignore trailing slashes in URLs
 babel = Babel(app)
 
-COMMANDS = collections.defaultdict(hedy_content.NoSuchCommand)
-for lang in ALL_LANGUAGES.keys():
-    COMMANDS[lang] = hedy_content.Commands(lang)
-
-ADVENTURES = collections.defaultdict(hedy_content.NoSuchAdventure)
-for lang in ALL_LANGUAGES.keys():
-    ADVENTURES[lang] = hedy_content.Adventures(lang)
-
-PARSONS = collections.defaultdict()
-for lang in ALL_LANGUAGES.keys():
-    PARSONS[lang] = hedy_content.ParsonsProblem(lang)
-
-QUIZZES = collections.defaultdict(hedy_content.NoSuchQuiz)
-for lang in ALL_LANGUAGES.keys():
-    QUIZZES[lang] = hedy_content.Quizzes(lang)
-
-TUTORIALS = collections.defaultdict(hedy_content.NoSuchTutorial)
-for lang in ALL_LANGUAGES.keys():
-    TUTORIALS[lang] = hedy_content.Tutorials(lang)
-
-SLIDES = collections.defaultdict(hedy_content.NoSuchSlides)
-for lang in ALL_LANGUAGES.keys():
-    SLIDES[lang] = hedy_content.Slides(lang)
+COMMANDS = hedy_content.ContentPerLanguage(hedy_content.Commands, hedy_content.NoSuchCommand)
+ADVENTURES = hedy_content.ContentPerLanguage(hedy_content.Adventures, hedy_content.NoSuchAdventure)
+PARSONS = hedy_content.ContentPerLanguage(hedy_content.ParsonsProblem)
+QUIZZES = hedy_content.ContentPerLanguage(hedy_content.Quizzes, hedy_content.NoSuchQuiz)
+TUTORIALS = hedy_content.ContentPerLanguage(hedy_content.Tutorials, hedy_content.NoSuchTutorial)
+SLIDES = hedy_content.ContentPerLanguage(hedy_content.Slides, hedy_content.NoSuchSlides)
 
 ACHIEVEMENTS_TRANSLATIONS = hedyweb.AchievementTranslations()
 DATABASE = database.Database()
@@ -96,7 +78,8 @@ def load_adventures_for_level(level):
     """Load the adventures for the given level.
 
     Adventures are loaded in the current language, with the keywords in the code
-    translated to the default (or explicitly requested) keyword language.
+    translated to the default (or explicitly requested) keyword language, in the
+    order of ADVENTURE_ORDER_PER_LEVEL.
     """
     keyword_lang = request.args.get('keyword_language', default=g.keyword_lang, type=str)
 
@@ -113,41 +96,13 @@ def load_adventures_for_level(level):
             if (program_key not in loaded_programs or loaded_programs[program_key]['date'] < program['date']):
                 loaded_programs[program_key] = program
 
-    all_adventures = []
-    adventures = ADVENTURES[g.lang].get_adventures(keyword_lang)
-
-    for short_name, adventure in adventures.items():
-        if level not in adventure['levels']:
-            continue
-        current_adventure = {
-            'short_name': short_name,
-            'name': adventure['name'],
-            'image': adventure.get('image', None),
-            'default_save_name': adventure.get('default_save_name', adventure['name']),
-            'text': adventure['levels'][level].get('story_text', ""),
-            'example_code': adventure['levels'][level].get('example_code', ""),
-            'start_code': adventure['levels'][level].get('start_code', ""),
-            'loaded_program': '' if not loaded_programs.get(short_name) else {
-                'name': loaded_programs.get(short_name)['name'],
-                'code': loaded_programs.get(short_name)['code']
-            }
-        }
-        # Sometimes we have multiple text and example_code -> iterate these and add as well!
-        extra_stories = []
-        for i in range(2, 10):
-            extra_story = {}
-            if adventure['levels'][level].get('story_text_' + str(i)):
-                extra_story['text'] = adventure['levels'][level].get(
-                    'story_text_' + str(i))
-                if adventure['levels'][level].get('example_code_' + str(i)):
-                    extra_story['example_code'] = adventure['levels'][level].get(
-                        'example_code_' + str(i))
-                extra_stories.append(extra_story)
-            else:
-                break
-        current_adventure['extra_stories'] = extra_stories
-        all_adventures.append(current_adventure)
-    return all_adventures
+    # the adventures are shared, so we add the program of the user to a copy
+    adventures = []
+    for adventure in ADVENTURES[g.lang].get_adventures_for_level(level, keyword_lang):
+        program = loaded_programs.get(adventure['short_name'])
+        loaded_program = {'name': program['name'], 'code': program['code']} if program else ''
+        adventures.append(dict(adventure, loaded_program=loaded_program))
+    return adventures
 
 
 @babel.localeselector
@@ -268,10 +223,7 @@ def setup_language():
 
     g.lang = session['lang']
     if 'keyword_lang' not in session:
-        if g.lang in ALL_KEYWORD_LANGUAGES.keys() and g.lang in NON_LATIN_LANGUAGES:
-            g.keyword_lang = g.lang
-        else:
-            g.keyword_lang = "en"
+        g.keyword_lang = hedy_content.default_keyword_language(g.lang)
     else:
         g.keyword_lang = session['keyword_lang']
 
@@ -371,6 +323,7 @@ def parse():
     response = {}
     username = current_user()['username'] or None
     exception = None
+    transpile_result = None
 
     querylog.log_value(level=level, lang=lang,
                        session_id=utils.session_id(), username=username)
@@ -408,12 +361,16 @@ def parse():
         except Exception:
             pass
         try:
-            response['has_sleep'] = 'sleep' in hedy.all_commands(code, level, lang)
+            # only parse the code again if the transpiler didn't give us its commands
+            if transpile_result is not None:
+                response['has_sleep'] = 'sleep' in transpile_result.commands
+            else:
+                response['has_sleep'] = 'sleep' in hedy.all_commands(code, level, lang)
         except BaseException:
             pass
         try:
             if username and not body.get('tutorial') and ACHIEVEMENTS.verify_run_achievements(
-                    username, code, level, response):
+                    username, code, level, response, transpile_result):
                 response['achievements'] = ACHIEVEMENTS.get_earned_achievements()
         except Exception as E:
             print(f"error determining achievements for {code} with {E}")
@@ -511,11 +468,13 @@ def prepare_files():
     lines = [x for x in lines if ("time.sleep" not in x) and ("t.pencolor" not in x)]
 
     threader += "  " + "\n  ".join(lines)
-    threader += "\n" + 't.save("machine_files/' + filename + '.dst")'
-    threader += "\n" + 't.save("machine_files/' + filename + '.png")'
+    # the filename is passed in as a variable, so the compiled program can be reused for the same code
+    threader += "\n" + 't.save("machine_files/" + filename + ".dst")'
+    threader += "\n" + 't.save("machine_files/" + filename + ".png")'
     if not os.path.isdir('machine_files'):
         os.makedirs('machine_files')
-    exec(threader)
+    # a plain exec: large designs can take a while, and what the program prints doesn't matter here
+    exec(program_runner.compile_program(threader), {'__name__': '__main__', 'filename': filename})
 
     # stolen from: https://stackoverflow.com/questions/28568687/send-with-multiple-csvs-using-flask
 
@@ -551,7 +510,7 @@ def transpile_add_stats(code, level, lang_):
     username = current_user()['username'] or None
     number_of_lines = code.count('\n')
     try:
-        result = hedy.transpile(code, level, lang_)
+        result = hedy.transpile_with_time_budget(code, level, lang_, session_id=utils.session_id())
         statistics.add(
             username, lambda id_: DATABASE.add_program_stats(id_, level, number_of_lines, None))
         return result
@@ -937,15 +896,6 @@ def index(level, program_id):
     # the one stored in the g object
     adventures = load_adventures_for_level(level)
 
-    # Sort the adventures based on the ordering defined
-    adventures_order = ADVENTURE_ORDER_PER_LEVEL[level]
-    index_map = {v: i for i, v in enumerate(adventures_order)}
-    adventures = sorted(
-        adventures,
-        key=lambda pair: index_map.get(
-            pair['short_name'],
-            len(adventures_order)))
-
     # Initially all levels are available -> strip those for which conditions
     # are not met or not available yet
     available_levels = list(range(1, hedy.HEDY_MAX_LEVEL + 1))
@@ -1503,9 +1453,7 @@ def normalize_explore_programs(programs):
     - Add 'number_lines'
     """
     ret = []
-    for program in programs:
-        program = pre_process_explore_program(program)
-
+    for program in pre_process_explore_programs(programs):
         ret.append(dict(program,
                         hedy_choice=True if program.get('hedy_choice') == 1 else False,
                         code="\n".join(program['code'].split("\n")[:4]),
@@ -1514,18 +1462,26 @@ def normalize_explore_programs(programs):
     return ret
 
 
+# Programs on the explore page that don't have an error value yet are transpiled in worker processes, one for
+# every this many programs up to a maximum. A handful of programs is transpiled in this process, since starting
+# a worker takes longer than that.
+EXPLORE_PROGRAMS_PER_WORKER = 5
+EXPLORE_MAX_WORKERS = 4
+
+
 @querylog.timed
-def pre_process_explore_program(program):
-    # If program does not have an error value set -> parse it and set value
-    if 'error' not in program:
-        try:
-            hedy.transpile(program.get('code'), program.get('level'), program.get('lang'))
-            program['error'] = False
-        except BaseException:
-            program['error'] = True
+def pre_process_explore_programs(programs):
+    # If a program does not have an error value set -> parse it and set value
+    unchecked = [program for program in programs if 'error' not in program]
+    workers = min(len(unchecked) // EXPLORE_PROGRAMS_PER_WORKER, EXPLORE_MAX_WORKERS) or 1
+    items = [(program.get('code'), program.get('level'), program.get('lang')) for program in unchecked]
+    # the workers load the parsers of the programs they get, instead of all parsers of a language
+    outcomes = hedy.transpile_many(items, workers=workers, langs=())
+    for program, (_, exception) in zip(unchecked, outcomes):
+        program['error'] = exception is not None
         DATABASE.store_program(program)
 
-    return program
+    return programs
 
 
 @app.route('/highscores', methods=['GET'], defaults={'filter': 'global'})
@@ -2006,7 +1962,8 @@ def on_server_start():
 
     Use this to initialize objects, dependencies and connections.
     """
-    pass
+    # Pick up the parsers that other workers (or a previous run) already compiled
+    hedy.preload_parsers(range(1, hedy.HEDY_MAX_LEVEL + 1))
 
 
 def try_parse_int(x):
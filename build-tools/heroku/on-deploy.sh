@@ -31,3 +31,6 @@ echo '-----> Compiling Babel translations'
 
 echo '-----> Generating static Babel content'
 ./generate-static-babel-content
+
+echo '-----> Compiling content bundles'
+./generate-content-bundles
@@ -15,6 +15,11 @@ class HedyException(Exception):
         self.error_code = error_code
         self.arguments = arguments
 
+    def __reduce__(self):
+        # Subclasses take other arguments than the error code, so they can't be unpickled by calling
+        # the constructor with self.args (like Exception does). This restores the attributes instead.
+        return restore_exception, (self.__class__, self.args, self.__dict__)
+
     @property
     def error_location(self):
         """Return the location where the error was found.
@@ -31,6 +36,13 @@ class HedyException(Exception):
         return None
 
 
+def restore_exception(cls, args, attributes):
+    exception = cls.__new__(cls)
+    exception.args = args
+    exception.__dict__.update(attributes)
+    return exception
+
+
 class WarningException(HedyException):
     """Fixed That For You warning/exception.
 
@@ -140,6 +152,12 @@ class InputTooBigException(HedyException):
                          max_lines=max_lines)
 
 
+class TranspileTimeoutException(HedyException):
+    def __init__(self, time_budget):
+        super().__init__('Too Slow',
+                         time_budget=time_budget)
+
+
 class InvalidCommandException(WarningException):
     def __init__(
             self,
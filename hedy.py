@@ -1,28 +1,45 @@
+import bisect
+import copy
+import hashlib
+import importlib
+import inspect
+import logging
+import os
+import pickle
+import sys
 import textwrap
+import time
+import types
 
 import lark
-from flask_babel import gettext
+from flask_babel import gettext, get_locale
 from lark import Lark
-from lark.exceptions import UnexpectedEOF, UnexpectedCharacters, VisitError
+from lark.exceptions import LarkError, UnexpectedEOF, UnexpectedCharacters, VisitError
 from lark import Tree, Transformer, visitors, v_args
 from os import path
 
 import warnings
 import hedy
 import hedy_translation
+import keyword_registry
 from hedy_content import ALL_KEYWORD_LANGUAGES
 import utils
-from collections import namedtuple
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
 import re
 import regex
 from dataclasses import dataclass, field
 import exceptions
 import program_repair
-import yaml
+from bounded_cache import BoundedCache
+from website import querylog
 
 # Some useful constants
 from hedy_content import KEYWORDS
 
+logger = logging.getLogger(__name__)
+
 HEDY_MAX_LEVEL = 18
 MAX_LINES = 100
 LEVEL_STARTING_INDENTATION = 8
@@ -143,13 +160,54 @@ PYTHON_KEYWORDS = [
 # Python keywords and function names need hashing when used as var names
 reserved_words = set(PYTHON_BUILTIN_FUNCTIONS + PYTHON_KEYWORDS)
 
-# Let's retrieve all keywords dynamically from the cached KEYWORDS dictionary
-indent_keywords = {}
-for lang, keywords in KEYWORDS.items():
-    indent_keywords[lang] = []
-    for keyword in ['if', 'elif', 'for', 'repeat', 'while', 'else']:
-        indent_keywords[lang].append(keyword)  # always also check for En
-        indent_keywords[lang].append(keywords.get(keyword))
+# The keywords that start a line that requires indentation
+INDENT_KEYWORDS = ['if', 'elif', 'for', 'repeat', 'while', 'else']
+
+
+def indent_keywords(lang):
+    """The keywords that start an indented block in a language, in English and in the language itself."""
+    keywords = KEYWORDS.get(lang) or KEYWORDS['en']
+    # always also check for En
+    return [k for keyword in INDENT_KEYWORDS for k in [keyword, keywords.get(keyword)]]
+
+
+# The preprocessor looks at the keywords at the start of every line, so per language we compile regexes that
+# match those keywords in English and in the language itself
+PreprocessorPatterns = namedtuple('PreprocessorPatterns', [
+    'starts_with_if', 'starts_with_else', 'contains_else', 'contains_pressed', 'contains_command',
+    'requires_indentation'])
+
+
+def keywords_pattern(keywords):
+    return '|'.join(re.escape(keyword) for keyword in keywords if keyword is not None)
+
+
+def create_preprocessor_patterns(lang):
+    def keywords(*commands):
+        if lang not in ALL_KEYWORD_LANGUAGES:
+            return keywords_pattern(commands)
+        return keywords_pattern([k for command in commands for k in [command, KEYWORDS[lang].get(command)]])
+
+    # languages without keywords only check the start of the line for if and else, not the word after them
+    word_end = '(?: |\\Z)' if lang in ALL_KEYWORD_LANGUAGES else ''
+    # also `    for    ` and `repeat 3 times:` require indentation, but `forward 100` doesn't
+    return PreprocessorPatterns(
+        starts_with_if=re.compile(f'(?:{keywords("if")}){word_end}'),
+        starts_with_else=re.compile(f'(?:{keywords("else")}){word_end}'),
+        contains_else=re.compile(keywords('else')),
+        contains_pressed=re.compile(keywords('pressed')),
+        contains_command=re.compile(keywords('print', 'ask', 'forward', 'turn')),
+        requires_indentation=re.compile(f'(?:{keywords_pattern(indent_keywords(lang))})(?:[ :]|\\Z)'))
+
+
+# Created for a language when it is first used
+PREPROCESSOR_PATTERNS = {}
+
+
+def get_preprocessor_patterns(lang):
+    if lang not in PREPROCESSOR_PATTERNS:
+        PREPROCESSOR_PATTERNS[lang] = create_preprocessor_patterns(lang)
+    return PREPROCESSOR_PATTERNS[lang]
 
 # These are the preprocessor rules that we use to specify changes in the rules that
 # are expected to work across several rules
@@ -331,43 +389,32 @@ character_skulpt_cannot_parse = re.compile('[^a-zA-Z0-9_]')
 def get_list_keywords(commands, to_lang):
     """ Returns a list with the local keywords of the argument 'commands'
     """
+    en_keywords = keyword_registry.get_language('en').defaults
+    if not keyword_registry.has_language(to_lang):
+        return [en_keywords[command] for command in commands]
+    to_keywords = keyword_registry.get_language(to_lang).defaults
+    return [to_keywords.get(command, en_keywords[command]) for command in commands]
 
-    translation_commands = []
-    dir = path.abspath(path.dirname(__file__))
-    path_keywords = dir + "/content/keywords"
 
-    to_yaml_filesname_with_path = path.join(path_keywords, to_lang + '.yaml')
-    en_yaml_filesname_with_path = path.join(path_keywords, 'en' + '.yaml')
-
-    with open(en_yaml_filesname_with_path, 'r', encoding='utf-8') as stream:
-        en_yaml_dict = yaml.safe_load(stream)
-
-    try:
-        with open(to_yaml_filesname_with_path, 'r', encoding='utf-8') as stream:
-            to_yaml_dict = yaml.safe_load(stream)
-        for command in commands:
-            try:
-                translation_commands.append(to_yaml_dict[command])
-            except Exception:
-                translation_commands.append(en_yaml_dict[command])
-    except Exception:
-        for command in commands:
-            translation_commands.append(en_yaml_dict[command])
-
-    return translation_commands
+# Every invalid command error looks for the closest command, so we only read the keyword files once per
+# language and level
+SUGGESTIONS_CACHE = {}
 
 
 def get_suggestions_for_language(lang, level):
     if not local_keywords_enabled:
         lang = 'en'
 
-    lang_commands = get_list_keywords(commands_per_level[level], lang)
+    key = (lang, level)
+    if key not in SUGGESTIONS_CACHE:
+        lang_commands = get_list_keywords(commands_per_level[level], lang)
 
-    # if we allow multiple keyword languages:
-    en_commands = get_list_keywords(commands_per_level[level], 'en')
-    en_lang_commands = list(set(en_commands + lang_commands))
+        # if we allow multiple keyword languages:
+        en_commands = get_list_keywords(commands_per_level[level], 'en')
+        # unlike a set, a dict keeps the order of the commands, so ties are always broken the same way
+        SUGGESTIONS_CACHE[key] = tuple(dict.fromkeys(lang_commands + en_commands))
 
-    return en_lang_commands
+    return SUGGESTIONS_CACHE[key]
 
 
 def escape_var(var):
@@ -399,21 +446,29 @@ def style_command(command):
 def closest_command_with_min_distance(invalid_command, commands, threshold):
     # FH, early 2020: simple string distance, could be more sophisticated MACHINE LEARNING!
 
-    minimum_distance = 1000
+    minimum_distance = threshold + 1
     closest_command = None
     for command in commands:
-        minimum_distance_for_command = calculate_minimum_distance(command, invalid_command)
-        if minimum_distance_for_command < minimum_distance and minimum_distance_for_command <= threshold:
+        # only a command that is closer than the closest one so far is interesting
+        minimum_distance_for_command = calculate_minimum_distance(command, invalid_command, minimum_distance - 1)
+        if minimum_distance_for_command < minimum_distance:
             minimum_distance = minimum_distance_for_command
             closest_command = command
+            if minimum_distance == 0:
+                break
 
     return closest_command
 
 
-def calculate_minimum_distance(s1, s2):
-    """Return string distance between 2 strings."""
+def calculate_minimum_distance(s1, s2, max_distance=None):
+    """Return string distance between 2 strings.
+
+    If a max_distance is given, we stop as soon as we know the distance is larger and return max_distance + 1.
+    """
     if len(s1) > len(s2):
         s1, s2 = s2, s1
+    if max_distance is not None and len(s2) - len(s1) > max_distance:
+        return max_distance + 1
     distances = range(len(s1) + 1)
     for index2, char2 in enumerate(s2):
         new_distances = [index2 + 1]
@@ -423,6 +478,9 @@ def calculate_minimum_distance(s1, s2):
             else:
                 new_distances.append(1 + min((distances[index1], distances[index1 + 1], new_distances[-1])))
         distances = new_distances
+        # distances never get smaller further down the table
+        if max_distance is not None and min(distances) > max_distance:
+            return max_distance + 1
     return distances[-1]
 
 
@@ -446,6 +504,38 @@ class LookupEntry:
     currently_inferring: bool = False  # used to detect cyclic type inference
 
 
+# The lookup table of a program: its lookup entries in the order they were collected, indexed by name. Names are
+# resolved for almost every node of the tree, so we don't want to go through all entries for that.
+class SymbolTable:
+    def __init__(self):
+        self.entries = []
+        self.entries_by_name = {}
+        # for every name, the sorted line numbers at which it is defined
+        self.lines_by_name = {}
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        self.entries.append(entry)
+        self.entries_by_name.setdefault(entry.name, []).append(entry)
+        bisect.insort(self.lines_by_name.setdefault(entry.name, []), entry.linenumber)
+
+    def get(self, name):
+        """Return the entries with the given name, in the order they were collected."""
+        return self.entries_by_name.get(name, [])
+
+    def is_defined(self, name):
+        return name in self.entries_by_name
+
+    def count_definitions_before(self, name, line_number):
+        """Return how many entries with the given name are defined on or before the given line."""
+        return bisect.bisect_right(self.lines_by_name.get(name, []), line_number)
+
+
 class TypedTree(Tree):
     def __init__(self, data, children, meta, type_):
         super().__init__(data, children, meta)
@@ -503,7 +593,7 @@ class LookupEntryCollector(visitors.Visitor):
     def __init__(self, level):
         super().__init__()
         self.level = level
-        self.lookup = []
+        self.lookup = SymbolTable()
 
     def ask(self, tree):
         # in level 1 there is no variable name on the left side of the ask command
@@ -559,7 +649,107 @@ class LookupEntryCollector(visitors.Visitor):
         entry = LookupEntry(name, tree, linenumber, skip_hashing)
         hashed_name = escape_var(entry)
         entry.name = hashed_name
-        self.lookup.append(entry)
+        self.lookup.add(entry)
+
+
+# Collects everything we need to know about the AST before generating code in a single traversal: the entries of
+# the lookup table, the first command that misses its arguments and whether the program uses the turtle or pygame.
+# Types can only be validated once the whole lookup table is known, so that is still done by the TypeValidator.
+class SemanticAnalyzer(LookupEntryCollector):
+    turtle_commands = {'forward', 'color', 'turn'}
+    pygame_commands = {'ifpressed', 'ifpressed_else', 'assign_button'}
+    # leafs are always complete, we don't look any further into them
+    complete_leafs = {'var', 'random', 'number'}
+    # tokens that all_commands and all_print_arguments leave out
+    ignored_tokens = {'INT', 'NAME', 'NUMBER', 'POSITIVE_NUMBER', 'NEGATIVE_NUMBER'}
+
+    def __init__(self, level):
+        super().__init__(level)
+        self.incomplete_command = None
+        self.has_turtle = False
+        self.has_pygame = False
+        self.node_count = 0
+        # an echo is lonely when no ask comes before it
+        self.has_ask = False
+        self.has_lonely_echo = False
+        # the same as all_commands and all_print_arguments return
+        self.commands = []
+        self.print_arguments = []
+
+    def analyze(self, tree):
+        # the traversal is top down and left to right, so lookup entries are stored in the same order as in
+        # LookupEntryCollector.visit_topdown and the first incomplete command is the first one in the program
+        stack = [(tree, True)]
+        while stack:
+            node, check_completeness = stack.pop()
+            if not isinstance(node, Tree):
+                self.collect_token(node)
+                continue
+
+            self.node_count += 1
+            self._call_userfunc(node)
+            if node.data in self.turtle_commands:
+                self.has_turtle = True
+            elif node.data in self.pygame_commands:
+                self.has_pygame = True
+            elif node.data == 'ask':
+                self.has_ask = True
+            elif node.data == 'echo' and not self.has_ask:
+                self.has_lonely_echo = True
+            self.collect_commands(node)
+
+            if check_completeness:
+                completeness = self.completeness(node)
+                if completeness is not None:
+                    # commands that can miss arguments decide for their whole subtree whether they are complete
+                    check_completeness = False
+                    complete, command_and_line = completeness
+                    if not complete and self.incomplete_command is None:
+                        self.incomplete_command = command_and_line
+
+            for child in reversed(node.children):
+                stack.append((child, check_completeness))
+        return self
+
+    def collect_commands(self, tree):
+        self.commands += commands_of_rule(tree.data, self.level)
+        if tree.data == 'list_access' and tree.children[1] == 'random' and not isinstance(tree.children[1], lark.Token):
+            # ExtractAST replaces the random node of the parse tree by its name
+            self.commands += commands_of_rule('random', self.level)
+        elif tree.data == 'text':
+            self.print_arguments.append(tree.children[0])
+
+    def collect_token(self, token):
+        # AllCommands and AllPrintArguments return the tokens they have no rule for, like the key of an ifpressed
+        if isinstance(token, lark.Token) and token.type not in self.ignored_tokens:
+            self.commands.append(token)
+            self.print_arguments.append(token)
+
+    def completeness(self, tree):
+        # print, ask and echo can miss arguments and then are not complete
+        # used to generate more informative error messages
+        args = tree.children
+        if tree.data == 'ask':
+            # in level 1 ask without arguments means args == []
+            # in level 2 and up, ask without arguments is a list of 1, namely the var name
+            incomplete = (args == [] and self.level == 1) or (len(args) == 1 and self.level >= 2)
+            return not incomplete, ('ask', tree.meta.line)
+        if tree.data == 'print':
+            return args != [], ('print', tree.meta.line)
+        if tree.data == 'input':
+            return len(args) > 1, ('input', tree.meta.line)
+        if tree.data == 'length':
+            return args != [], ('len', tree.meta.line)
+        if tree.data == 'error_print_nq':
+            return args != [], ('print level 2', tree.meta.line)
+        if tree.data == 'echo':
+            # echo may miss an argument
+            return True, ('echo', tree.meta.line)
+        if tree.data == 'text':
+            return all(args), ''.join(args)
+        if tree.data in self.complete_leafs:
+            return True, None
+        return None
 
 
 # The transformer traverses the whole AST and infers the type of each node. It alters the lookup table entries with
@@ -850,9 +1040,8 @@ class TypeValidator(Transformer):
         return type_ in [HedyType.any, HedyType.none]
 
     def save_type_to_lookup(self, name, inferred_type):
-        for entry in self.lookup:
-            if entry.name == escape_var(name):
-                entry.type_ = inferred_type
+        for entry in self.lookup.get(escape_var(name)):
+            entry.type_ = inferred_type
 
     # Usually, variable definitions are sequential and by the time we need the type of a lookup entry, it would already
     #  be inferred. However, there are valid cases in which the lookup entries will be accessed before their type
@@ -863,7 +1052,7 @@ class TypeValidator(Transformer):
     #  lookup entry is used to infer the type and continue the started validation. This approach might cause issues
     #  in case of cyclic references, e.g. b is b + 1. The flag `inferring` is used as a guard against these cases.
     def try_get_type_from_lookup(self, name):
-        matches = [entry for entry in self.lookup if entry.name == escape_var(name)]
+        matches = self.lookup.get(escape_var(name))
         if matches:
             match = matches[0]
             if not match.type_:
@@ -912,8 +1101,7 @@ def are_all_arguments_true(args):
     return all(bool_arguments), arguments_of_false_nodes
 
 
-# this class contains code shared between IsValid and IsComplete, which are quite similar
-# because both filter out some types of 'wrong' nodes
+# this class contains the code used by IsValid to filter out the 'wrong' nodes of the parse tree
 @v_args(meta=True)
 class Filter(Transformer):
     def __default__(self, data, children, meta):
@@ -946,104 +1134,46 @@ class Filter(Transformer):
         return all(args), ''.join([c for c in args]), meta
 
 
-class UsesTurtle(Transformer):
-    def __default__(self, args, children, meta):
-        if len(children) == 0:  # no children? you are a leaf that is not Turn or Forward, so you are no Turtle command
-            return False
-        else:
-            return any(type(c) == bool and c is True for c in children)
-
-    # returns true if Forward or Turn are in the tree, false otherwise
-    def forward(self, args):
-        return True
-
-    def color(self, args):
-        return True
-
-    def turn(self, args):
-        return True
-
-    # somehow tokens are not picked up by the default rule so they need their own rule
-    def INT(self, args):
-        return False
-
-    def NAME(self, args):
-        return False
-
-    def NUMBER(self, args):
-        return False
-
-    def POSITIVE_NUMBER(self, args):
-        return False
+# some keywords have names that are not a valid name for a command
+# that's why we call them differently in the grammar
+# we have to translate them to the regular names here for further communciation
+COMMAND_NAMES = {
+    'assign': 'is',
+    'assign_list': 'is',
+    'ifelse': 'else',
+    'ifs': 'if',
+    'elifs': 'elif',
+    'for_loop': 'for',
+    'for_list': 'for',
+    'or_condition': 'or',
+    'and_condition': 'and',
+    'while_loop': 'while',
+    'in_list_check': 'in',
+    'input_empty_brackets': 'input',
+    'print_empty_brackets': 'print',
+}
 
-    def NEGATIVE_NUMBER(self, args):
-        return False
+# for the achievements we want to be able to also detct which operators were used by a kid
+command_operators = ['addition', 'subtraction', 'multiplication', 'division']
 
 
-class UsesPyGame(Transformer):
-    def __default__(self, args, children, meta):
-        if len(children) == 0:  # no children? you are a leaf that is not Pressed, so you are no PyGame command
-            return False
-        else:
-            return any(type(c) == bool and c is True for c in children)
-
-    def ifpressed(self, args):
-        return True
-
-    def ifpressed_else(self, args):
-        return True
-
-    def assign_button(self, args):
-        return True
+def commands_of_rule(rule, level):
+    """Return the commands (as returned by all_commands) that a node of the given rule stands for."""
+    name = COMMAND_NAMES.get(rule, str(rule))
+    if name in commands_per_level[level] or name in command_operators:
+        if name == 'else':  # use of else also has an if
+            return ['if', 'else']
+        return [name]
+    return []
 
 
 class AllCommands(Transformer):
     def __init__(self, level):
         self.level = level
 
-    def translate_keyword(self, keyword):
-        # some keywords have names that are not a valid name for a command
-        # that's why we call them differently in the grammar
-        # we have to translate them to the regular names here for further communciation
-        if keyword in ['assign', 'assign_list']:
-            return 'is'
-        if keyword == 'ifelse':
-            return 'else'
-        if keyword == 'ifs':
-            return 'if'
-        if keyword == 'elifs':
-            return 'elif'
-        if keyword == 'for_loop':
-            return 'for'
-        if keyword == 'for_list':
-            return 'for'
-        if keyword == 'or_condition':
-            return 'or'
-        if keyword == 'and_condition':
-            return 'and'
-        if keyword == 'while_loop':
-            return 'while'
-        if keyword == 'in_list_check':
-            return 'in'
-        if keyword == 'input_empty_brackets':
-            return 'input'
-        if keyword == 'print_empty_brackets':
-            return 'print'
-        return str(keyword)
-
     def __default__(self, args, children, meta):
-        # if we are matching a rule that is a command
-        production_rule_name = self.translate_keyword(args)
-        leaves = flatten_list_of_lists_to_list(children)
-        # for the achievements we want to be able to also detct which operators were used by a kid
-        operators = ['addition', 'subtraction', 'multiplication', 'division']
-
-        if production_rule_name in commands_per_level[self.level] or production_rule_name in operators:
-            if production_rule_name == 'else':  # use of else also has an if
-                return ['if', 'else'] + leaves
-            return [production_rule_name] + leaves
-        else:
-            return leaves  # 'pop up' the children
+        # if we are matching a rule that is a command, otherwise we 'pop up' the children
+        return commands_of_rule(args, self.level) + flatten_list_of_lists_to_list(children)
 
     def command(self, args):
         return args
@@ -1170,66 +1300,100 @@ class IsValid(Filter):
     # other rules are inherited from Filter
 
 
-def valid_echo(ast):
-    commands = ast.children
-    command_names = [x.children[0].data for x in commands]
-    no_echo = 'echo' not in command_names
+def process_characters_needing_escape(value):
+    # defines what happens if a kids uses ' or \ in in a string
+    for c in characters_that_need_escaping:
+        value = value.replace(c, f'\\{c}')
+    return value
 
-    # no echo is always ok!
 
-    # otherwise, both have to be in the list and echo shold come after
-    return no_echo or ('echo' in command_names and 'ask' in command_names) and command_names.index(
-        'echo') > command_names.index('ask')
+def get_allowed_types(command, level):
+    # get only the allowed types of the command for all levels before the requested level
+    allowed = [values for key, values in commands_and_types_per_level[command].items() if key <= level]
+    # use the allowed types of the highest level available
+    return allowed[-1] if allowed else []
 
 
-@v_args(meta=True)
-class IsComplete(Filter):
-    def __init__(self, level):
-        self.level = level
-    # print, ask and echo can miss arguments and then are not complete
-    # used to generate more informative error messages
-    # tree is transformed to a node of [True] or [False, args, line_number]
+# Blocks of generated code are indented once for every block they are in. Instead of indenting their text over
+# and over, the transpilers build GeneratedCode out of strings and indented blocks, of which the text is only
+# put together once, when the program is turned into a string.
+class GeneratedCode:
+    __slots__ = ('parts',)
 
-    def ask(self, meta, args):
-        # in level 1 ask without arguments means args == []
-        # in level 2 and up, ask without arguments is a list of 1, namely the var name
-        incomplete = (args == [] and self.level == 1) or (len(args) == 1 and self.level >= 2)
-        if meta is not None:
-            return not incomplete, ('ask', meta.line)
-        else:
-            return not incomplete, ('ask', 1)
+    def __init__(self, *parts):
+        self.parts = parts
 
-    def print(self, meta, args):
-        return args != [], ('print', meta.line)
+    def __add__(self, other):
+        return GeneratedCode(self, other)
 
-    def input(self, meta, args):
-        return len(args) > 1, ('input', meta.line)
+    def __radd__(self, other):
+        return GeneratedCode(other, self)
 
-    def length(self, meta, args):
-        return args != [], ('len', meta.line)
+    def __str__(self):
+        fragments = []
+        self.render(fragments, '')
+        return ''.join(fragments)
 
-    def error_print_nq(self, meta, args):
-        return args != [], ('print level 2', meta.line)
+    def __format__(self, format_spec):
+        return format(str(self), format_spec)
 
-    def echo(self, meta, args):
-        # echo may miss an argument
-        return True, ('echo', meta.line)
+    def render(self, fragments, indentation):
+        for part in self.parts:
+            if isinstance(part, GeneratedCode):
+                part.render(fragments, indentation)
+            elif indentation:
+                fragments.append(str(part).replace('\n', '\n' + indentation))
+            else:
+                fragments.append(str(part))
+
+    def reversed_fragments(self):
+        stack = [self]
+        while stack:
+            part = stack.pop()
+            if isinstance(part, IndentedCode):
+                stack.append(' ' * part.spaces)
+                stack.extend(part.parts)
+            elif isinstance(part, GeneratedCode):
+                stack.extend(part.parts)
+            else:
+                yield str(part)
 
-    # other rules are inherited from Filter
 
+class IndentedCode(GeneratedCode):
+    __slots__ = ('spaces',)
 
-def process_characters_needing_escape(value):
-    # defines what happens if a kids uses ' or \ in in a string
-    for c in characters_that_need_escaping:
-        value = value.replace(c, f'\\{c}')
-    return value
+    def __init__(self, code, spaces):
+        super().__init__(code)
+        self.spaces = spaces
 
+    def render(self, fragments, indentation):
+        # like indenting the text, this indents the first line and every line after a newline
+        fragments.append(' ' * self.spaces)
+        super().render(fragments, indentation + ' ' * self.spaces)
 
-def get_allowed_types(command, level):
-    # get only the allowed types of the command for all levels before the requested level
-    allowed = [values for key, values in commands_and_types_per_level[command].items() if key <= level]
-    # use the allowed types of the highest level available
-    return allowed[-1] if allowed else []
+
+def join_code(separator, parts):
+    if all(isinstance(part, str) for part in parts):
+        return separator.join(parts)
+    joined = []
+    for part in parts:
+        if joined:
+            joined.append(separator)
+        joined.append(part)
+    return GeneratedCode(*joined)
+
+
+def last_word(code):
+    if isinstance(code, str):
+        return code.split()[-1]
+    # only look at as much of the end of the code as needed to find its last word
+    tail = ''
+    for fragment in code.reversed_fragments():
+        tail = fragment + tail
+        words = tail.split()
+        if len(words) > 1 or (words and tail[0].isspace()):
+            return words[-1]
+    return tail.split()[-1]
 
 
 # decorator used to store each class in the lookup table
@@ -1250,18 +1414,16 @@ class ConvertToPython(Transformer):
     # default for line number is max lines so if it is not given, there
     # is no check on whether the var is defined
     def is_variable(self, variable_name, access_line_number=100):
-        all_names = [a.name for a in self.lookup]
-        all_names_before_access_line = [a.name for a in self.lookup if a.linenumber <= access_line_number]
-
-        if variable_name in all_names and variable_name not in all_names_before_access_line:
+        if (self.lookup.is_defined(variable_name)
+                and self.lookup.count_definitions_before(variable_name, access_line_number) == 0):
             # referenced before assignment!
-            definition_line_number = [a.linenumber for a in self.lookup if a.name == variable_name][0]
+            definition_line_number = self.lookup.get(variable_name)[0].linenumber
             raise hedy.exceptions.AccessBeforeAssign(
                 name=variable_name,
                 access_line_number=access_line_number,
                 definition_line_number=definition_line_number)
 
-        return escape_var(variable_name) in all_names_before_access_line
+        return self.lookup.count_definitions_before(escape_var(variable_name), access_line_number) > 0
 
     def process_variable(self, arg, access_line_number=100):
         # processes a variable by hashing and escaping when needed
@@ -1359,8 +1521,7 @@ class ConvertToPython(Transformer):
 
     @staticmethod
     def indent(s, spaces_amount=2):
-        lines = s.split('\n')
-        return '\n'.join([' ' * spaces_amount + line for line in lines])
+        return IndentedCode(s, spaces_amount)
 
 
 @v_args(meta=True)
@@ -1940,8 +2101,7 @@ class ConvertToPython_6(ConvertToPython_5):
 
 
 def sleep_after(commands, indent=True):
-    lines = commands.split()
-    if lines[-1] == "time.sleep(0.1)":  # we don't sleep double so skip if final line is a sleep already
+    if last_word(commands) == "time.sleep(0.1)":  # we don't sleep double so skip if final line is a sleep already
         return commands
 
     sleep_command = "time.sleep(0.1)" if indent is False else "  time.sleep(0.1)"
@@ -1968,7 +2128,7 @@ class ConvertToPython_7(ConvertToPython_6):
 class ConvertToPython_8_9(ConvertToPython_7):
 
     def command(self, meta, args):
-        return "".join(args)
+        return join_code("", args)
 
     def repeat(self, meta, args):
         # todo fh, may 2022, could be merged with 7 if we make
@@ -1978,19 +2138,19 @@ class ConvertToPython_8_9(ConvertToPython_7):
         times = self.process_variable(args[0], meta.line)
 
         all_lines = [ConvertToPython.indent(x) for x in args[1:]]
-        body = "\n".join(all_lines)
+        body = join_code("\n", all_lines)
         body = sleep_after(body)
 
-        return f"for {var_name} in range(int({times})):\n{body}"
+        return f"for {var_name} in range(int({times})):\n" + body
 
     def ifs(self, meta, args):
         all_lines = [ConvertToPython.indent(x) for x in args[1:]]
-        return "if " + args[0] + ":\n" + "\n".join(all_lines)
+        return "if " + args[0] + ":\n" + join_code("\n", all_lines)
 
     def ifpressed(self, met, args):
         args = [a for a in args if a != ""]  # filter out in|dedent tokens
 
-        all_lines = '\n'.join([x for x in args[1:]])
+        all_lines = join_code('\n', args[1:])
         all_lines = ConvertToPython.indent(all_lines)
         var_or_key = args[0]
         # if this is a variable, we assume it is a key (for now)
@@ -2014,7 +2174,7 @@ if event.key == {button_name}:
     def ifpressed_else(self, met, args):
         args = [a for a in args if a != ""]  # filter out in|dedent tokens
 
-        all_lines = '\n'.join([x for x in args[1:]])
+        all_lines = join_code('\n', args[1:])
         all_lines = ConvertToPython.indent(all_lines)
 
         if (len(args[0]) > 1):
@@ -2035,14 +2195,14 @@ if event.unicode == '{args[0]}':
         args = [a for a in args if a != ""]  # filter out in|dedent tokens
         all_lines = [ConvertToPython.indent(x) for x in args]
 
-        return "\nelse:\n" + "\n".join(all_lines)
+        return "\nelse:\n" + join_code("\n", all_lines)
 
     def ifpressed_elses(self, meta, args):
         args = [a for a in args if a != ""]  # filter out in|dedent tokens
         args += ["  break\n"]
 
-        all_lines = "\n".join(
-            [ConvertToPython.indent(x, 4) for x in args]
+        all_lines = join_code(
+            "\n", [ConvertToPython.indent(x, 4) for x in args]
         )
 
         return all_lines
@@ -2066,11 +2226,11 @@ class ConvertToPython_10(ConvertToPython_8_9):
         args = [a for a in args if a != ""]  # filter out in|dedent tokens
         times = self.process_variable(args[0], meta.line)
 
-        body = "\n".join([ConvertToPython.indent(x) for x in args[2:]])
+        body = join_code("\n", [ConvertToPython.indent(x) for x in args[2:]])
 
         body = sleep_after(body, True)
 
-        return f"for {times} in {args[1]}:\n{body}"
+        return f"for {times} in {args[1]}:\n" + body
 
 
 @v_args(meta=True)
@@ -2079,14 +2239,14 @@ class ConvertToPython_11(ConvertToPython_10):
     def for_loop(self, meta, args):
         args = [a for a in args if a != ""]  # filter out in|dedent tokens
         iterator = escape_var(args[0])
-        body = "\n".join([ConvertToPython.indent(x) for x in args[3:]])
+        body = join_code("\n", [ConvertToPython.indent(x) for x in args[3:]])
         body = sleep_after(body)
         stepvar_name = self.get_fresh_var('step')
         begin = self.process_token_or_tree(args[1])
         end = self.process_token_or_tree(args[2])
         return f"""{stepvar_name} = 1 if {begin} < {end} else -1
 for {iterator} in range({begin}, {end} + {stepvar_name}, {stepvar_name}):
-{body}"""
+""" + body
 
 
 @v_args(meta=True)
@@ -2265,7 +2425,7 @@ class ConvertToPython_15(ConvertToPython_14):
     def while_loop(self, meta, args):
         args = [a for a in args if a != ""]  # filter out in|dedent tokens
         all_lines = [ConvertToPython.indent(x) for x in args[1:]]
-        body = "\n".join(all_lines)
+        body = join_code("\n", all_lines)
         body = sleep_after(body)
         exceptions = self.make_catch_exception([args[0]])
         return exceptions + "while " + args[0] + ":\n" + body
@@ -2294,7 +2454,7 @@ class ConvertToPython_16(ConvertToPython_15):
     def ifs(self, meta, args):
         all_lines = [ConvertToPython.indent(x) for x in args[1:]]
         exceptions = self.make_catch_exception([args[0]])
-        return exceptions + "if " + args[0] + ":\n" + "\n".join(all_lines)
+        return exceptions + "if " + args[0] + ":\n" + join_code("\n", all_lines)
 
 
 @v_args(meta=True)
@@ -2303,7 +2463,7 @@ class ConvertToPython_17(ConvertToPython_16):
     def elifs(self, meta, args):
         args = [a for a in args if a != ""]  # filter out in|dedent tokens
         all_lines = [ConvertToPython.indent(x) for x in args[1:]]
-        return "\nelif " + args[0] + ":\n" + "\n".join(all_lines)
+        return "\nelif " + args[0] + ":\n" + join_code("\n", all_lines)
 
 
 @v_args(meta=True)
@@ -2429,6 +2589,27 @@ def get_remaining_rules(orig_def, sub_def):
 
 
 def create_grammar(level, lang="en"):
+    """Return the complete grammar for a level.
+
+    Outside of debug mode we use the merged grammar written to grammars-Total by
+    build-tools/heroku/generate-total-grammars, if it was generated from the current
+    grammar files. Otherwise the grammar files are merged here.
+    """
+    if not utils.is_debug_mode():
+        prebuilt = load_total_grammar_file(level, lang)
+        if prebuilt is not None:
+            return prebuilt
+
+    result = merge_grammars_for_level(level, lang)
+
+    # ready? Save to file to ease debugging
+    if utils.is_debug_mode():
+        save_total_grammar_file(level, result, lang)
+
+    return result
+
+
+def merge_grammars_for_level(level, lang="en"):
     # start with creating the grammar for level 1
     result = get_full_grammar_for_level(1)
     keywords = get_keywords_for_language(lang)
@@ -2438,22 +2619,65 @@ def create_grammar(level, lang="en"):
     for i in range(2, level + 1):
         grammar_text_i = get_additional_rules_for_level(i)
         result = merge_grammars(result, grammar_text_i, i)
+    return result
 
-    # ready? Save to file to ease debugging
-    # this could also be done on each merge for performance reasons
-    save_total_grammar_file(level, result, lang)
 
-    return result
+# The first line of a file in grammars-Total records a hash of the grammar files it was
+# merged from, so we never load a merged grammar that is out of date.
+TOTAL_GRAMMAR_HEADER = '// merged from grammar files with hash '
+GRAMMAR_SOURCES_HASH = None
 
 
-def save_total_grammar_file(level, grammar, lang):
+def get_total_grammar_filename(level, lang):
     # Load Lark grammars relative to directory of current file
     script_dir = path.abspath(path.dirname(__file__))
     filename = "level" + str(level) + "." + lang + "-Total.lark"
-    loc = path.join(script_dir, "grammars-Total", filename)
-    file = open(loc, "w", encoding="utf-8")
-    file.write(grammar)
-    file.close()
+    return path.join(script_dir, "grammars-Total", filename)
+
+
+def save_total_grammar_file(level, grammar, lang):
+    with open(get_total_grammar_filename(level, lang), "w", encoding="utf-8") as file:
+        file.write(TOTAL_GRAMMAR_HEADER + get_grammar_sources_hash() + '\n')
+        file.write(grammar)
+
+
+def load_total_grammar_file(level, lang):
+    """Return the merged grammar from grammars-Total, or None if it is missing or out of date."""
+    try:
+        with open(get_total_grammar_filename(level, lang), "r", encoding="utf-8") as file:
+            header = file.readline()
+            if header != TOTAL_GRAMMAR_HEADER + get_grammar_sources_hash() + '\n':
+                return None
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def get_grammar_sources_hash():
+    """Return a hash of all files in the grammars folder and of the code that merges them.
+
+    The hash is computed once per process, except in debug mode where the grammar files
+    may be edited while the server is running.
+    """
+    global GRAMMAR_SOURCES_HASH
+    if GRAMMAR_SOURCES_HASH is None or utils.is_debug_mode():
+        grammars_dir = path.join(path.abspath(path.dirname(__file__)), "grammars")
+        digest = hashlib.md5()
+        for filename in sorted(os.listdir(grammars_dir)):
+            with open(path.join(grammars_dir, filename), "rb") as file:
+                digest.update(filename.encode('utf-8'))
+                digest.update(file.read())
+        for function in grammar_merge_functions():
+            digest.update(inspect.getsource(function).encode('utf-8'))
+        GRAMMAR_SOURCES_HASH = digest.hexdigest()
+    return GRAMMAR_SOURCES_HASH
+
+
+def grammar_merge_functions():
+    # A merged grammar also depends on how we merge, so a change to any of these makes the files in
+    # grammars-Total out of date, just like a change to a grammar file does.
+    return [merge_grammars_for_level, get_keywords_for_language, merge_grammars, merge_rules_operator,
+            get_remaining_rules, *PREPROCESS_RULES.values()]
 
 
 def get_additional_rules_for_level(level, sub=0):
@@ -2495,30 +2719,279 @@ def get_keywords_for_language(language):
 
 PARSER_CACHE = {}
 
+# Building the Earley parser tables for a level takes up to a couple of seconds, and every
+# gunicorn worker used to do that again for every (level, lang) it encountered. Compiled
+# parsers are therefore also stored on disk, where other workers and restarted processes
+# can pick them up. The files are named after a hash of the merged grammar, the parser
+# options and the Lark version, so a changed grammar or an upgraded Lark never loads a stale parser.
+# Loading a parser unpickles it, which can run any code, so the cache is kept in a directory of the app that
+# only we can write to, and files that somebody else owns are never loaded.
+PARSER_CACHE_DIR = os.getenv('HEDY_PARSER_CACHE_DIR', path.join(path.abspath(path.dirname(__file__)), 'parser-cache'))
+
 
 def get_parser(level, lang="en", keep_all_tokens=False):
     """Return the Lark parser for a given level.
 
     Uses caching if Hedy is NOT running in development mode.
     """
-    key = str(level) + "." + lang + '.' + str(keep_all_tokens)
+    key = parser_cache_key(level, lang, keep_all_tokens)
     existing = PARSER_CACHE.get(key)
     if existing and not utils.is_debug_mode():
         return existing
     grammar = create_grammar(level, lang)
-    ret = Lark(grammar, regex=True, propagate_positions=True, keep_all_tokens=keep_all_tokens)  # ambiguity='explicit'
+    ret = create_parser(grammar, keep_all_tokens)
     PARSER_CACHE[key] = ret
     return ret
 
 
-ParseResult = namedtuple('ParseResult', ['code', 'has_turtle', 'has_pygame'])
+def parser_cache_key(level, lang, keep_all_tokens):
+    return str(level) + "." + lang + '.' + str(keep_all_tokens)
+
 
+def create_parser(grammar, keep_all_tokens=False):
+    """Return a Lark parser for the given grammar, loaded from the disk cache if possible."""
+    filename = parser_cache_filename(grammar, keep_all_tokens)
+    parser = load_parser_from_disk(filename)
+    if parser is None:
+        parser = Lark(grammar, regex=True, propagate_positions=True, keep_all_tokens=keep_all_tokens)  # ambiguity='explicit'
+        save_parser_to_disk(filename, parser)
+    return parser
 
-def transpile(input_string, level, lang="en"):
-    transpile_result = transpile_inner(input_string, level, lang)
+
+def parser_cache_filename(grammar, keep_all_tokens):
+    fingerprint = '|'.join([lark.__version__, str(keep_all_tokens), grammar])
+    digest = hashlib.md5(fingerprint.encode('utf-8')).hexdigest()
+    return path.join(PARSER_CACHE_DIR, f'{digest}.parser')
+
+
+def load_parser_from_disk(filename):
+    try:
+        with open(filename, 'rb') as f:
+            if not is_owned_by_us(f):
+                logger.warning('Not loading cached parser %s, it is owned by another user', filename)
+                return None
+            return ParserUnpickler(f).load()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # A corrupt or incompatible cache file is not fatal, we just build the parser again
+        logger.warning('Error loading cached parser %s: %s', filename, e)
+        return None
+
+
+def save_parser_to_disk(filename, parser):
+    # Written atomically, since multiple workers might be building the same parser in parallel
+    try:
+        os.makedirs(path.dirname(filename), mode=0o700, exist_ok=True)
+        with utils.atomic_write_file(filename) as f:
+            ParserPickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(parser)
+    except (IOError, pickle.PicklingError) as e:
+        logger.warning('Error writing cached parser %s: %s', filename, e)
+
+
+def is_owned_by_us(file):
+    # there are no file owners on Windows
+    return not hasattr(os, 'getuid') or os.fstat(file.fileno()).st_uid == os.getuid()
+
+
+class ParserPickler(pickle.Pickler):
+    """Pickles a Lark parser.
+
+    Lark keeps references to the regex module it uses (re or regex), which cannot be
+    pickled. We store those by name and import them again when unpickling.
+    """
+
+    def persistent_id(self, obj):
+        if isinstance(obj, types.ModuleType):
+            return obj.__name__
+        return None
+
+
+class ParserUnpickler(pickle.Unpickler):
+    def persistent_load(self, module_name):
+        return importlib.import_module(module_name)
+
+
+def preload_parsers(levels, lang="en"):
+    """Fill the in-memory parser cache from the disk cache.
+
+    Only parsers that are already on disk are loaded, so this never builds a parser
+    and is cheap to call when a worker starts.
+    """
+    for level in levels:
+        key = parser_cache_key(level, lang, False)
+        if key in PARSER_CACHE:
+            continue
+        parser = load_parser_from_disk(parser_cache_filename(create_grammar(level, lang), False))
+        if parser is not None:
+            PARSER_CACHE[key] = parser
+
+
+# Besides the Python code, a ParseResult holds the commands and print arguments of the program (as returned by
+# all_commands and all_print_arguments, but as tuples), so callers don't have to parse the program again to find
+# them. The transpile cache hands out the same ParseResult to every caller, so it can't be changed.
+class ParseResult(namedtuple('ParseResult', ['code', 'has_turtle', 'has_pygame', 'commands', 'print_arguments'])):
+    __slots__ = ()
+
+    @property
+    def command_counts(self):
+        return Counter(self.commands)
+
+
+# Classrooms run the same (start) code over and over, so we remember the outcome of
+# recent transpilations: either a ParseResult or the HedyException that was raised.
+# We only remember outcomes that follow from the key alone (the program, level, language,
+# UI locale and grammars), so not timeouts or errors for which the repair budget ran out.
+TRANSPILE_CACHE = BoundedCache(max_bytes=int(os.getenv('HEDY_TRANSPILE_CACHE_BYTES', 32 * 1024 * 1024)))
+
+
+# Some programs, like long lines of operators or deeply nested ifs, take the Earley parser seconds to parse.
+# That blocks the worker that is also serving the rest of the classroom, so when transpiling a program for a
+# request we give up on it after this many seconds of CPU time (0 disables the time budget).
+TRANSPILE_TIME_BUDGET = float(os.getenv('HEDY_TRANSPILE_TIME_BUDGET', 5))
+
+
+def transpile(input_string, level, lang="en", session_id=None, time_budget=0):
+    """Transpile a Hedy program to Python.
+
+    Pass the session_id when transpiling programs that are being edited, so the parse trees of the
+    statements that didn't change since the last program of the session are reused. With a time_budget,
+    a TranspileTimeoutException is raised when parsing and transpiling take more than that many seconds of
+    CPU time. Looking up and storing the result in the cache doesn't count, and is never interrupted.
+    """
+    # In debug mode the grammars and transpiler may change under our feet
+    if utils.is_debug_mode():
+        return transpile_in_time(input_string, level, lang, session_id, time_budget)
+
+    key = transpile_cache_key(input_string, level, lang)
+    cached = TRANSPILE_CACHE.get(key)
+    if cached is not None:
+        querylog.log_counter('transpile_cache_hit')
+        if isinstance(cached, exceptions.HedyException):
+            raise copy_exception(cached)
+        return cached
+
+    querylog.log_counter('transpile_cache_miss')
+    try:
+        transpile_result = transpile_in_time(input_string, level, lang, session_id, time_budget)
+    except exceptions.TranspileTimeoutException:
+        # running out of time depends on how busy we are, so we don't remember that
+        raise
+    except exceptions.HedyException as ex:
+        # neither do we remember errors for which the repair budget ran out
+        if not getattr(ex, 'repairs_cut_short', False):
+            TRANSPILE_CACHE.put(key, copy_exception(ex),
+                                sys.getsizeof(input_string) + sys.getsizeof(repr(ex.arguments)))
+        raise
+    TRANSPILE_CACHE.put(key, transpile_result, sys.getsizeof(input_string) + sys.getsizeof(repr(transpile_result)))
     return transpile_result
 
 
+def transpile_in_time(input_string, level, lang, session_id, time_budget):
+    # The caches that transpile_inner updates itself do so in utils.without_time_limit blocks
+    with utils.time_limit(time_budget, timeout_exception, cpu_time=True):
+        return transpile_inner(input_string, level, lang, session_id)
+
+
+def transpile_with_time_budget(input_string, level, lang="en", session_id=None):
+    """Transpile a Hedy program like transpile does, for a request.
+
+    Raises a TranspileTimeoutException when that takes more than TRANSPILE_TIME_BUDGET seconds of CPU time.
+    """
+    if TRANSPILE_TIME_BUDGET > 0 and int(level) <= HEDY_MAX_LEVEL:
+        # building the parser can take a couple of seconds by itself, that doesn't count
+        get_parser(int(level), lang)
+
+    querylog.log_value(transpile_time_budget_ms=int(TRANSPILE_TIME_BUDGET * 1000))
+    try:
+        return transpile(input_string, level, lang, session_id, time_budget=TRANSPILE_TIME_BUDGET)
+    except exceptions.TranspileTimeoutException:
+        querylog.log_counter('transpile_timeout')
+        raise
+
+
+def timeout_exception():
+    return exceptions.TranspileTimeoutException(time_budget=TRANSPILE_TIME_BUDGET)
+
+
+# Offline jobs (validating snippets, analyzing downloaded programs) transpile thousands of programs, and the
+# explore page checks the public programs that were never checked before. transpile_many spreads those over
+# worker processes, keeping at most this many programs per worker in flight so items can come from a
+# generator over a large number of programs.
+TRANSPILE_MANY_PROGRAMS_PER_WORKER = 8
+
+
+def transpile_many(items, workers=None, langs=('en',)):
+    """Transpile many programs in a pool of worker processes.
+
+    The items are (input_string, level) or (input_string, level, lang) tuples. Yields a (ParseResult, exception)
+    tuple for every item, in the order of the items, of which exactly one is None: exceptions are captured
+    instead of raised, so one bad program doesn't end the job. Workers load the parsers of the given languages
+    from the disk cache when they start, and keep the parsers they build for the rest of the job. With a single
+    worker the programs are transpiled in this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for item in items:
+            yield transpile_item(item)
+        return
+
+    with ProcessPoolExecutor(workers, initializer=start_transpile_worker, initargs=(langs,)) as executor:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(transpile_item, item))
+                if len(pending) >= workers * TRANSPILE_MANY_PROGRAMS_PER_WORKER:
+                    yield future_outcome(pending.popleft())
+            while pending:
+                yield future_outcome(pending.popleft())
+        finally:
+            # when the caller stops early, don't wait for the programs it's no longer interested in
+            for future in pending:
+                future.cancel()
+
+
+def start_transpile_worker(langs):
+    for lang in langs:
+        preload_parsers(range(1, HEDY_MAX_LEVEL + 1), lang)
+
+
+def transpile_item(item):
+    try:
+        return transpile(*item), None
+    except Exception as ex:
+        return None, ex
+
+
+def future_outcome(future):
+    # transpile_item captures exceptions, but sending the outcome back from the worker can still fail
+    exception = future.exception()
+    if exception is not None:
+        return None, exception
+    return future.result()
+
+
+def transpile_cache_key(input_string, level, lang):
+    # The generated code contains translated error messages, so the UI locale is part of the key. The grammar
+    # hash is computed once per process, like the transpiler code is loaded once: the cache lives in memory, so
+    # it starts empty whenever new grammars or code are loaded. In debug mode, where both are reloaded while we
+    # run, the cache is not used.
+    code_hash = hashlib.md5(input_string.encode('utf-8')).hexdigest()
+    return (code_hash, str(level), lang, str(get_locale()), get_grammar_sources_hash())
+
+
+def copy_exception(ex):
+    """Return a copy of a HedyException without its traceback.
+
+    Callers are free to change the arguments of the exception they catch (translate_error
+    does that), so the cache hands out copies instead of the instance it holds.
+    """
+    result = ex.__class__.__new__(ex.__class__)
+    result.args = ex.args
+    result.__dict__.update(copy.deepcopy(ex.__dict__))
+    return result
+
+
 def translate_characters(s):
     # this method is used to make it more clear to kids what is meant in error messages
     # for example ' ' is hard to read, space is easier
@@ -2557,13 +3030,7 @@ def beautify_parse_error(character_found):
 
 
 def find_indent_length(line):
-    number_of_spaces = 0
-    for x in line:
-        if x == ' ':
-            number_of_spaces += 1
-        else:
-            break
-    return number_of_spaces
+    return len(line) - len(line.lstrip(' '))
 
 
 def line_requires_indentation(line, lang):
@@ -2571,32 +3038,59 @@ def line_requires_indentation(line, lang):
     # because now a line like `repeat is 5` would also require indentation!
 
     line = line.lstrip()  # remove spaces since also `    for    ` requires indentation
-    if lang not in indent_keywords.keys():  # some language like Greek or Czech do not have local keywords
-        lang = 'en'
+    # We can't just split since some langs like French have keywords containing a space
+    return get_preprocessor_patterns(lang).requires_indentation.match(line) is not None
 
-    local_indent_keywords = indent_keywords[lang]
 
-    for k in local_indent_keywords:
-        # does the line start with this keyword?
-        # We can't just split since some langs like French have keywords containing a space
-        # We also have to check space/lineending/: after or forward 100 wil also require indentation
-        end_of_line_or_word = (len(line) > len(k) and (
-            line[len(k)] == " " or line[len(k)] == ":")) or len(line) == len(k)
-        if end_of_line_or_word and line[:len(k)] == k:
-            return True
-    return False
+def preprocess_if_line(line, next_line, patterns):
+    # if this line starts with if but does not contain an else, and the next line too is not an else.
+    if (patterns.starts_with_if.match(line) and not patterns.starts_with_else.match(next_line)
+            and not patterns.contains_else.search(line)):
+        # is this line just a condition and no other keyword (because that is no problem)
+        # and this should also (TODO) check for a second is cause that too is problematic.
+        if not patterns.contains_pressed.search(line) and patterns.contains_command.search(line):
+            # a second command, but also no else in this line -> check next line!
 
+            # no else in next line?
+            # add a nop (like 'Pass' but we just insert a meaningless assign)
+            return line + " else _ is x"
+    return line
 
-def preprocess_blocks(code, level, lang):
-    processed_code = []
+
+def preprocess_ifs(code, lang='en'):
+    lines = code.split("\n")
+    patterns = get_preprocessor_patterns(lang)
+    # always add the last line (if it has if and no else that is no problem)
+    processed_code = [preprocess_if_line(line, next_line, patterns) for line, next_line in zip(lines, lines[1:])]
+    processed_code.append(lines[-1])
+    return "\n".join(processed_code)
+
+
+def preprocess_lines(code, level, lang):
+    """Prepare a program for the parser of levels 5 and up in a single pass over its lines.
+
+    In levels 5 to 8 we do not allow if without else, so we add an empty assignment as else to an if with a
+    command on the same line. From level 8 we add #ENDBLOCK to the line that ends an indented block.
+    """
     lines = code.split("\n")
+    patterns = get_preprocessor_patterns(lang)
+    add_else = level <= 8
+    add_blocks = level >= hedy.LEVEL_STARTING_INDENTATION
+
+    processed_code = []
     current_number_of_indents = 0
     previous_number_of_indents = 0
     indent_size = 4  # set at 4 for now
     indent_size_adapted = False  # FH We can remove this now since we changed in indenter a bit in Nov 2022
     line_number = 0
     next_line_needs_indentation = False
-    for line in lines:
+    for index, line in enumerate(lines):
+        if add_else and index < len(lines) - 1:
+            line = preprocess_if_line(line, lines[index + 1], patterns)
+        if not add_blocks:
+            processed_code.append(line)
+            continue
+
         if ' _ ' in line or line == '_':
             raise hedy.exceptions.CodePlaceholdersPresentException
 
@@ -2614,17 +3108,20 @@ def preprocess_blocks(code, level, lang):
             indent_size = leading_spaces
             indent_size_adapted = True
 
+        def fix_indent():
+            # the fix is made in the code with the ifs preprocessed
+            fixed_lines = preprocess_ifs(code, lang) if add_else else code
+            return program_repair.fix_indent(fixed_lines, line_number, leading_spaces, indent_size)
+
         # indentation size not 4
         if (leading_spaces % indent_size) != 0:
             # there is inconsistent indentation, not sure if that is too much or too little!
             if leading_spaces < current_number_of_indents * indent_size:
-                fixed_code = program_repair.fix_indent(code, line_number, leading_spaces, indent_size)
                 raise hedy.exceptions.NoIndentationException(line_number=line_number, leading_spaces=leading_spaces,
-                                                             indent_size=indent_size, fixed_code=fixed_code)
+                                                             indent_size=indent_size, fixed_code=fix_indent())
             else:
-                fixed_code = program_repair.fix_indent(code, line_number, leading_spaces, indent_size)
                 raise hedy.exceptions.IndentationException(line_number=line_number, leading_spaces=leading_spaces,
-                                                           indent_size=indent_size, fixed_code=fixed_code)
+                                                           indent_size=indent_size, fixed_code=fix_indent())
 
         # happy path, multiple of 4 spaces:
         current_number_of_indents = leading_spaces // indent_size
@@ -2634,32 +3131,23 @@ def preprocess_blocks(code, level, lang):
         if current_number_of_indents > previous_number_of_indents and not next_line_needs_indentation:
             # we are indenting, but this line is not following* one that even needs indenting, raise
             # * note that we have not yet updated the value of 'next line needs indenting' so if refers to this line!
-            fixed_code = program_repair.fix_indent(code, line_number, leading_spaces, indent_size)
             raise hedy.exceptions.IndentationException(line_number=line_number, leading_spaces=leading_spaces,
-                                                       indent_size=indent_size, fixed_code=fixed_code)
+                                                       indent_size=indent_size, fixed_code=fix_indent())
 
         if next_line_needs_indentation and current_number_of_indents <= previous_number_of_indents:
-            fixed_code = program_repair.fix_indent(code, line_number, leading_spaces, indent_size)
             raise hedy.exceptions.NoIndentationException(line_number=line_number, leading_spaces=leading_spaces,
-                                                         indent_size=indent_size, fixed_code=fixed_code)
+                                                         indent_size=indent_size, fixed_code=fix_indent())
 
         if current_number_of_indents - previous_number_of_indents > 1:
-            fixed_code = program_repair.fix_indent(code, line_number, leading_spaces, indent_size)
             raise hedy.exceptions.IndentationException(line_number=line_number, leading_spaces=leading_spaces,
-                                                       indent_size=indent_size, fixed_code=fixed_code)
+                                                       indent_size=indent_size, fixed_code=fix_indent())
 
         if current_number_of_indents < previous_number_of_indents:
             # we are dedenting ('jumping back) so we need to and an end-block
             # (multiple if multiple dedents are happening)
+            processed_code[-1] += '#ENDBLOCK' * (previous_number_of_indents - current_number_of_indents)
 
-            difference_in_indents = (previous_number_of_indents - current_number_of_indents)
-            for i in range(difference_in_indents):
-                processed_code[-1] += '#ENDBLOCK'
-
-        if line_requires_indentation(line, lang):
-            next_line_needs_indentation = True
-        else:
-            next_line_needs_indentation = False
+        next_line_needs_indentation = line_requires_indentation(line, lang)
 
         # save to compare for next line
         previous_number_of_indents = current_number_of_indents
@@ -2667,70 +3155,10 @@ def preprocess_blocks(code, level, lang):
         # if indent remains the same, do nothing, just add line
         processed_code.append(line)
 
-    # if the last line is indented, the end of the program is also the end of all indents
-    # so close all blocks
-    for i in range(current_number_of_indents):
-        processed_code[-1] += '#ENDBLOCK'
-    return "\n".join(processed_code)
-
-
-def preprocess_ifs(code, lang='en'):
-    processed_code = []
-    lines = code.split("\n")
-
-    def starts_with(command, line):
-        if lang in ALL_KEYWORD_LANGUAGES:
-            command_plus_translated_command = [command, KEYWORDS[lang].get(command)]
-            for c in command_plus_translated_command:
-                #  starts with the keyword and next character is a space
-                if line[0:len(c)] == c and (len(c) == len(line) or line[len(c)] == ' '):
-                    return True
-            return False
-        else:
-            return line[0:len(command)] == command
-
-    def contains(command, line):
-        if lang in ALL_KEYWORD_LANGUAGES:
-            command_plus_translated_command = [command, KEYWORDS[lang].get(command)]
-            for c in command_plus_translated_command:
-                if c in line:
-                    return True
-            return False
-        else:
-            return command in line
-
-    def contains_any_of(commands, line):
-        # translation is not needed here, happens in contains
-        if lang in ALL_KEYWORD_LANGUAGES:
-            for c in commands:
-                if contains(c, line):
-                    return True
-            return False
-        else:
-            for c in commands:
-                if contains(c, line):
-                    return True
-            return False
-    for i in range(len(lines) - 1):
-        line = lines[i]
-        next_line = lines[i + 1]
-
-        # if this line starts with if but does not contain an else, and the next line too is not an else.
-        if starts_with('if', line) and (not starts_with('else', next_line)) and (not contains('else', line)):
-            # is this line just a condition and no other keyword (because that is no problem)
-            commands = ["print", "ask", "forward", "turn"]
-
-            if (
-                not contains('pressed', line) and contains_any_of(commands, line)
-            ):  # and this should also (TODO) check for a second is cause that too is problematic.
-                # a second command, but also no else in this line -> check next line!
-
-                # no else in next line?
-                # add a nop (like 'Pass' but we just insert a meaningless assign)
-                line = line + " else _ is x"
-
-        processed_code.append(line)
-    processed_code.append(lines[-1])  # always add the last line (if it has if and no else that is no problem)
+    if add_blocks:
+        # if the last line is indented, the end of the program is also the end of all indents
+        # so close all blocks
+        processed_code[-1] += '#ENDBLOCK' * current_number_of_indents
     return "\n".join(processed_code)
 
 
@@ -2755,20 +3183,73 @@ def process_input_string(input_string, level, lang, escape_backslashes=True):
         result = result.replace("\\", "\\\\")
 
     # In levels 5 to 8 we do not allow if without else, we add an empty print to make it possible in the parser
-    if level >= 5 and level <= 8:
-        result = preprocess_ifs(result, lang)
-
     # In level 8 we add indent-dedent blocks to the code before parsing
-    if level >= hedy.LEVEL_STARTING_INDENTATION:
-        result = preprocess_blocks(result, level, lang)
+    if level >= 5:
+        result = preprocess_lines(result, level, lang)
 
     return result
 
 
-def parse_input(input_string, level, lang):
-    parser = get_parser(level, lang)
+class SourcePosition:
+    """The position of a node in the program, in the fields of lark's Meta that we use.
+
+    Lark's Meta keeps its fields (and some we never read) in a __dict__, which makes it the largest object of a
+    parse tree. The metas are shared by the trees that ExtractAST, TypeValidator and the transpilers make from the
+    parse tree, so they stay alive for the whole transpilation. Lark builds the tree with its own Meta, and
+    compact_positions replaces it by a SourcePosition before the tree is transformed.
+    """
+    __slots__ = ('empty', 'line', 'column', 'start_pos', 'end_line', 'end_column', 'end_pos')
+
+    def __init__(self, meta=None):
+        self.empty = meta is None or meta.empty
+        if not self.empty:
+            self.line = meta.line
+            self.column = meta.column
+            self.start_pos = meta.start_pos
+            self.end_line = meta.end_line
+            self.end_column = meta.end_column
+            self.end_pos = meta.end_pos
+
+    def shifted(self, lines, characters):
+        position = SourcePosition(self)
+        if not position.empty:
+            position.line += lines
+            position.end_line += lines
+            position.start_pos += characters
+            position.end_pos += characters
+        return position
+
+
+def compact_positions(tree):
+    """Replace lark's Meta of every node of a new parse tree by a SourcePosition, in place.
+
+    Each Meta is released as soon as its node has a SourcePosition, so there is never a second copy of the tree.
+    """
+    for node in tree.iter_subtrees_topdown():
+        # Tree.meta has no setter, and would create an empty Meta for nodes that have none
+        node._meta = SourcePosition(node._meta)
+    return tree
+
+
+def run_parser(code, level, lang):
+    return compact_positions(get_parser(level, lang).parse(code))
+
+
+# The editor sends the whole program on every run, while kids mostly change the end of their program. So for
+# every session we remember the parse trees of the top-level statements of the last program it parsed, and
+# only parse the program from its first changed statement onwards. Sizes are a rough estimate of the trees.
+PARSE_STATE_CACHE = BoundedCache(max_bytes=int(os.getenv('HEDY_PARSE_STATE_CACHE_BYTES', 64 * 1024 * 1024)))
+PARSE_STATE_BYTES_PER_CHARACTER = 100
+
+ParseState = namedtuple('ParseState', ['parser_key', 'statements', 'program_meta'])
+
+
+def parse_input(input_string, level, lang, session_id=None):
     try:
-        parse_result = parser.parse(input_string + '\n')
+        if session_id is None:
+            parse_result = run_parser(input_string + '\n', level, lang)
+        else:
+            parse_result = parse_incrementally(session_id, input_string + '\n', level, lang)
         return parse_result.children[0]  # getting rid of the root could also be done in the transformer would be nicer
     except lark.UnexpectedEOF:
         lines = input_string.split('\n')
@@ -2794,7 +3275,143 @@ def parse_input(input_string, level, lang):
             raise e
 
 
-def is_program_valid(program_root, input_string, level, lang):
+def parse_incrementally(session_id, code, level, lang):
+    """Parse a program, reusing the trees of the statements it shares with the last program of the session.
+
+    A statement starts at every line that is not indented and doesn't continue the statement above it (like else),
+    so that the unchanged statements at the start of a program are parsed the same as in the previous program.
+    Any parse error is reported by parsing the whole program, so errors are the same as without reusing trees.
+    """
+    parser_key = (level, lang, get_grammar_sources_hash())
+    statement_starts = find_statement_starts(code, lang)
+
+    reused = []
+    position = 0
+    state = PARSE_STATE_CACHE.get(session_id)
+    if state is not None and state.parser_key == parser_key:
+        for text, children in state.statements:
+            end = position + len(text)
+            if not code.startswith(text, position) or (end < len(code) and end not in statement_starts):
+                break
+            reused.append((text, children))
+            position = end
+
+    parse_result = None
+    if reused:
+        querylog.log_counter('parse_reused_statements', len(reused))
+        prefix = code[:position]
+        suffix = code[position:]
+        try:
+            suffix_program = parse_suffix(suffix, level, lang, prefix.count('\n'), len(prefix)) if suffix else None
+        except LarkError:
+            suffix_program = None
+        # without a suffix, we can only reuse the end of the previous program if this is the same program
+        if suffix_program is not None or (not suffix and len(reused) == len(state.statements)):
+            children = [child for _, statement_children in reused for child in statement_children]
+            # the program starts where the previous one started, and ends where the suffix ends
+            meta = SourcePosition(state.program_meta)
+            if suffix_program is not None:
+                children += suffix_program.children
+                for attribute in ['end_line', 'end_column', 'end_pos']:
+                    setattr(meta, attribute, getattr(suffix_program.meta, attribute))
+            parse_result = Tree('start', [Tree('program', children, meta)])
+    if parse_result is None:
+        parse_result = run_parser(code, level, lang)
+        reused = []
+        position = 0
+
+    new_children = parse_result.children[0].children[sum(len(children) for _, children in reused):]
+    new_statements = group_children_by_statement(code, position, statement_starts, new_children)
+    state = None if new_statements is None else ParseState(parser_key, reused + new_statements,
+                                                           parse_result.children[0].meta)
+    with utils.without_time_limit():
+        if state is None:
+            PARSE_STATE_CACHE.pop(session_id)
+        else:
+            PARSE_STATE_CACHE.put(session_id, state, len(code) * PARSE_STATE_BYTES_PER_CHARACTER)
+    return parse_result
+
+
+def find_statement_starts(code, lang):
+    """Return the offsets in the code at which a new top-level statement starts."""
+    continuations = {'else', 'elif', KEYWORDS.get(lang, {}).get('else'), KEYWORDS.get(lang, {}).get('elif')}
+    starts = [0]
+    offset = 0
+    for line in code.split('\n')[:-1]:
+        if offset > 0 and line and not line[0].isspace():
+            first_word = re.split(r'[\s:]', line, maxsplit=1)[0]
+            if first_word not in continuations:
+                starts.append(offset)
+        offset += len(line) + 1
+    return set(starts)
+
+
+def parse_suffix(suffix, level, lang, lines, characters):
+    """Parse the changed end of a program, returning its program tree with positions as if parsed in the whole program.
+
+    Returns None if the suffix can't be parsed on its own the same way as in the whole program.
+    """
+    program = run_parser(suffix, level, lang).children[0]
+    # from level 5, only the first line of a program can be an error_invalid instead of a command
+    if not program.children or not all(isinstance(child, Tree) and child.data == 'command' for child in program.children):
+        return None
+    return shift_positions(program, lines, characters)
+
+
+def shift_positions(tree, lines, characters):
+    """Return a copy of a parse tree with all its positions moved down by the given number of lines and characters."""
+    if isinstance(tree, lark.Token):
+        return lark.Token(tree.type, tree.value, tree.start_pos + characters, tree.line + lines, tree.column,
+                          tree.end_line + lines, tree.end_column, tree.end_pos + characters)
+    if not isinstance(tree, Tree):
+        return tree
+    return Tree(tree.data, [shift_positions(child, lines, characters) for child in tree.children],
+                tree.meta.shifted(lines, characters))
+
+
+def group_children_by_statement(code, position, statement_starts, children):
+    """Group the commands parsed from the code after the given position by the statements they are in.
+
+    Returns a list of (statement text, commands) tuples. Statements that share a command (because it spans
+    multiple lines that we didn't recognize as one statement) end up in the same group, as do statements without
+    commands (comments) and the statement after them. Returns None if a command has no position, since we then
+    can't tell to which statement it belongs.
+    """
+    starts = sorted(start for start in statement_starts if start > position)
+    groups = []
+    group_start, group_end, group_children = position, position, []
+    for child in children:
+        if child.meta.empty:
+            return None
+        first_statement = bisect.bisect_right(starts, child.meta.start_pos)
+        if group_children and first_statement > 0 and starts[first_statement - 1] >= group_end:
+            groups.append((code[group_start:group_end], group_children))
+            group_start, group_children = group_end, []
+        group_children.append(child)
+        # the statement after the last one this command is in
+        next_statement = bisect.bisect_right(starts, child.meta.end_pos - 1)
+        group_end = max(group_end, starts[next_statement] if next_statement < len(starts) else len(code))
+    if group_children:
+        groups.append((code[group_start:], group_children))
+    return groups
+
+
+def is_program_valid(program_root, input_string, level, lang, repair_budget=None):
+    # Without a repair budget, this is the program itself and not a repair of it
+    if repair_budget is not None:
+        return check_program_is_valid(program_root, input_string, level, lang, repair_budget, is_repair=True)
+
+    repair_budget = RepairBudget()
+    try:
+        check_program_is_valid(program_root, input_string, level, lang, repair_budget, is_repair=False)
+    except exceptions.HedyException as ex:
+        # How far we got repairing the program depends on how busy we were, so the fixed result of an
+        # error for which the budget ran out is not the one the program always gets
+        ex.repairs_cut_short = repair_budget.exhausted
+        raise
+
+
+def check_program_is_valid(program_root, input_string, level, lang, repair_budget, is_repair):
     # IsValid returns (True,) or (False, args)
     instance = IsValid()
     instance.level = level  # TODO: could be done in a constructor once we are sure we will go this way
@@ -2815,17 +3432,14 @@ def is_program_valid(program_root, input_string, level, lang):
 
             # the error here is a space at the beginning of a line, we can fix that!
             fixed_code = program_repair.remove_leading_spaces(input_string)
+            result = None
             if fixed_code != input_string:  # only if we have made a successful fix
-                try:
-                    fixed_result = transpile_inner(fixed_code, level, lang)
-                    result = fixed_result
-                    raise exceptions.InvalidSpaceException(
-                        level=level, line_number=line, fixed_code=fixed_code, fixed_result=result)
-                except exceptions.HedyException:
-                    invalid_info.error_type = None
-                    transpile_inner(fixed_code, level)
-                    # The fixed code contains another error. Only report the original error for now.
-                    pass
+                # if the fixed code contains another error, we report that one
+                result = transpile_repaired_program(fixed_code, level, lang, repair_budget)
+                if result is None and not is_repair:
+                    # The budget is used up, but this is only a warning: we run the program without the spaces,
+                    # so we need its result. Only the repairs of the fixed program are bounded.
+                    result = transpile_inner(fixed_code, level, lang, repair_budget=RepairBudget())
             raise exceptions.InvalidSpaceException(
                 level=level, line_number=line, fixed_code=fixed_code, fixed_result=result)
         elif invalid_info.error_type == 'invalid condition':
@@ -2867,8 +3481,9 @@ def is_program_valid(program_root, input_string, level, lang):
                 fixed_code = input_string.replace(invalid_command, closest)
                 if fixed_code != input_string:  # only if we have made a successful fix
                     try:
-                        fixed_result = transpile_inner(fixed_code, level)
-                        result = fixed_result
+                        result = transpile_repaired_program(fixed_code, level, lang, repair_budget)
+                    except exceptions.TranspileTimeoutException:
+                        raise
                     except exceptions.HedyException:
                         # The fixed code contains another error. Only report the original error for now.
                         pass
@@ -2878,48 +3493,127 @@ def is_program_valid(program_root, input_string, level, lang):
                                                      fixed_code=fixed_code, fixed_result=result)
 
 
-def is_program_complete(abstract_syntax_tree, level):
-    is_complete = IsComplete(level).transform(abstract_syntax_tree)
-    if not is_complete[0]:
-        incomplete_command_and_line = is_complete[1][0]
+# Repairing a program transpiles the fixed program, and a fixed program can need a repair of its own. To keep
+# the cost of reporting an error predictable, all repairs for one program together get at most this many
+# transpiles of fixed programs, and no new transpile is started after this many seconds.
+REPAIR_MAX_TRANSPILES = int(os.getenv('HEDY_REPAIR_MAX_TRANSPILES', 3))
+REPAIR_TIME_LIMIT = float(os.getenv('HEDY_REPAIR_TIME_LIMIT', 1))
+
+# Kids tend to make the same mistake over and over, so we remember the outcome of transpiling fixed programs
+REPAIR_CACHE = BoundedCache(max_bytes=int(os.getenv('HEDY_REPAIR_CACHE_BYTES', 8 * 1024 * 1024)))
+
+
+class RepairBudget:
+    def __init__(self):
+        self.transpiles_left = REPAIR_MAX_TRANSPILES
+        self.deadline = time.monotonic() + REPAIR_TIME_LIMIT
+        self.exhausted = False
+
+    def spend_transpile(self):
+        """Return whether there is budget left for another transpile, and if so, spend it."""
+        if self.transpiles_left <= 0 or time.monotonic() > self.deadline:
+            self.exhausted = True
+            return False
+        self.transpiles_left -= 1
+        return True
+
+
+def transpile_repaired_program(fixed_code, level, lang, repair_budget):
+    """Transpile a fixed program, returning its ParseResult or raising the HedyException it raises.
+
+    Returns None if the repair budget is used up, in which case we don't know whether the fixed program works.
+    """
+    key = transpile_cache_key(fixed_code, level, lang)
+    outcome = None if utils.is_debug_mode() else REPAIR_CACHE.get(key)
+    if outcome is None:
+        if not repair_budget.spend_transpile():
+            querylog.log_counter('repair_budget_exhausted')
+            return None
+        querylog.log_counter('repair_transpiles')
+        try:
+            outcome = transpile_inner(fixed_code, level, lang, repair_budget=repair_budget)
+        except exceptions.TranspileTimeoutException:
+            raise
+        except exceptions.HedyException as ex:
+            outcome = copy_exception(ex)
+        # when the budget ran out halfway, repairs of the fixed program may be missing, so we don't remember it
+        if not repair_budget.exhausted:
+            size = sys.getsizeof(fixed_code) + sys.getsizeof(repr(outcome))
+            with utils.without_time_limit():
+                REPAIR_CACHE.put(key, outcome, size)
+
+    if isinstance(outcome, exceptions.HedyException):
+        raise copy_exception(outcome)
+    return outcome
+
+
+def is_program_complete(analyzer, level):
+    incomplete_command_and_line = analyzer.incomplete_command
+    if incomplete_command_and_line is not None:
         incomplete_command = incomplete_command_and_line[0]
         line = incomplete_command_and_line[1]
         raise exceptions.IncompleteCommandException(incomplete_command=incomplete_command, level=level,
                                                     line_number=line)
 
 
-def create_lookup_table(abstract_syntax_tree, level, lang, input_string):
-    visitor = LookupEntryCollector(level)
-    visitor.visit_topdown(abstract_syntax_tree)
-    entries = visitor.lookup
+def validate_types(abstract_syntax_tree, lookup_table, level, lang, input_string):
+    # infers the types of the lookup table entries
+    TypeValidator(lookup_table, level, lang, input_string).transform(abstract_syntax_tree)
+
+
+# transpile_inner logs how many microseconds each of its stages takes (most take less than a millisecond) as the
+# <stage>_us fields of the querylog record, together with the size of the program. These are part of the querylog
+# record format, so keep them stable.
+TRANSPILE_STAGES = ['transpile_preprocess', 'transpile_parse', 'transpile_validate', 'transpile_analyze',
+                    'transpile_typecheck', 'transpile_codegen']
+TRANSPILE_COUNTS = ['transpile_lines', 'transpile_nodes', 'transpile_lookup_entries']
 
-    TypeValidator(entries, level, lang, input_string).transform(abstract_syntax_tree)
 
-    return entries
+@contextmanager
+def log_stage_time(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        querylog.log_counter(stage + '_us', int((time.perf_counter() - start) * 1000000))
 
 
-def transpile_inner(input_string, level, lang="en"):
+def transpile_inner(input_string, level, lang="en", session_id=None, repair_budget=None):
     check_program_size_is_valid(input_string)
 
     level = int(level)
     if level > HEDY_MAX_LEVEL:
         raise Exception(f'Levels over {HEDY_MAX_LEVEL} not implemented yet')
 
-    input_string = process_input_string(input_string, level, lang)
-    program_root = parse_input(input_string, level, lang)
+    # Repairs transpile fixed programs, their time is part of the validate stage of the program itself
+    def stage(name):
+        return log_stage_time(name) if repair_budget is None else nullcontext()
+
+    with stage('transpile_preprocess'):
+        input_string = process_input_string(input_string, level, lang)
+    with stage('transpile_parse'):
+        program_root = parse_input(input_string, level, lang, session_id)
 
-    # checks whether any error production nodes are present in the parse tree
-    is_program_valid(program_root, input_string, level, lang)
+    with stage('transpile_validate'):
+        # checks whether any error production nodes are present in the parse tree
+        is_program_valid(program_root, input_string, level, lang, repair_budget)
 
     try:
-        abstract_syntax_tree = ExtractAST().transform(program_root)
+        with stage('transpile_analyze'):
+            abstract_syntax_tree = ExtractAST().transform(program_root)
+            analyzer = SemanticAnalyzer(level).analyze(abstract_syntax_tree)
+        if repair_budget is None:
+            querylog.log_value(transpile_lines=input_string.count('\n') + 1, transpile_nodes=analyzer.node_count,
+                               transpile_lookup_entries=len(analyzer.lookup))
 
-        is_program_complete(abstract_syntax_tree, level)
+        is_program_complete(analyzer, level)
 
-        if not valid_echo(abstract_syntax_tree):
+        if analyzer.has_lonely_echo:
             raise exceptions.LonelyEchoException()
 
-        lookup_table = create_lookup_table(abstract_syntax_tree, level, lang, input_string)
+        lookup_table = analyzer.lookup
+        with stage('transpile_typecheck'):
+            validate_types(abstract_syntax_tree, lookup_table, level, lang, input_string)
 
         # FH, may 2022. for now, we just out arabic numerals when the language is ar
         # this can be changed into a profile setting or could be detected
@@ -2931,11 +3625,11 @@ def transpile_inner(input_string, level, lang="en"):
             numerals_language = "Latin"
         # grab the right transpiler from the lookup
         convertToPython = TRANSPILER_LOOKUP[level]
-        python = convertToPython(lookup_table, numerals_language).transform(abstract_syntax_tree)
+        with stage('transpile_codegen'):
+            python = convertToPython(lookup_table, numerals_language).transform(abstract_syntax_tree)
 
-        has_turtle = UsesTurtle().transform(abstract_syntax_tree)
-        has_pygame = UsesPyGame().transform(abstract_syntax_tree)
-        return ParseResult(python, has_turtle, has_pygame)
+        return ParseResult(python, analyzer.has_turtle, analyzer.has_pygame, tuple(analyzer.commands),
+                           tuple(analyzer.print_arguments))
     except VisitError as E:
         # Exceptions raised inside visitors are wrapped inside VisitError. Unwrap it if it is a
         # HedyException to show the intended error message.
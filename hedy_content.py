@@ -1,10 +1,17 @@
+import collections.abc
+import json
 import logging
+import mmap
 import os
+import pickle
+import struct
 
+import keyword_registry
 import static_babel_content
 
-from utils import customize_babel_locale
-from website.yaml_file import YamlFile
+from bounded_cache import BoundedCache
+from utils import atomic_write_file, customize_babel_locale, is_debug_mode
+from website.yaml_file import YAML_BYTES_PER_FILE_BYTE, YamlFile
 from safe_format import safe_format
 
 logger = logging.getLogger(__name__)
@@ -248,15 +255,179 @@ for lang in sorted(languages):
     if os.path.exists('./grammars/keywords-' + lang + '.lark'):
         ALL_KEYWORD_LANGUAGES[lang] = lang[0:2].upper()  # first two characters
 
-# Load and cache all keyword yamls
-KEYWORDS = {}
-for lang in ALL_KEYWORD_LANGUAGES.keys():
-    KEYWORDS[lang] = YamlFile.for_file(f'content/keywords/{lang}.yaml').to_dict()
-    for k, v in KEYWORDS[lang].items():
-        if isinstance(v, str) and "|" in v:
-            # when we have several options, pick the first one as default
-            # Some keys are ints, turn them into strings
-            KEYWORDS[lang][k] = v.split('|')[0]
+
+class KeywordsPerLanguage(collections.abc.Mapping):
+    """The default spelling of every keyword, for every keyword language.
+
+    The keywords of a language are only read when it is first used, so starting a worker doesn't read the
+    keyword files of all languages.
+    """
+
+    def __init__(self):
+        self._keywords = {}
+
+    def __getitem__(self, lang):
+        if lang not in self._keywords:
+            if lang not in ALL_KEYWORD_LANGUAGES:
+                raise KeyError(lang)
+            self._keywords[lang] = dict(keyword_registry.get_language(lang).defaults)
+        return self._keywords[lang]
+
+    def __iter__(self):
+        return iter(ALL_KEYWORD_LANGUAGES)
+
+    def __len__(self):
+        return len(ALL_KEYWORD_LANGUAGES)
+
+
+KEYWORDS = KeywordsPerLanguage()
+
+
+def default_keyword_language(lang):
+    """The keyword language of users of a language who haven't chosen one."""
+    return lang if lang in ALL_KEYWORD_LANGUAGES and lang in NON_LATIN_LANGUAGES else 'en'
+
+
+# The content of every language is compiled into a single bundle file on deploy, by
+# build-tools/heroku/generate-content-bundles. Workers memory-map the bundles, so the pages of the sections
+# they haven't decoded are shared between them, and decoding a section is a single unpickle.
+CONTENT_BUNDLES_DIRECTORY = 'content-bundles'
+BUNDLED_CONTENT = ['adventures', 'cheatsheets', 'parsons', 'quizzes', 'slides', 'tutorials']
+BUNDLE_MAGIC = b'HEDYBUNDLE1\n'
+BUNDLE_INDEX_LENGTH = struct.Struct('<I')
+
+
+def bundle_filename(lang):
+    return os.path.join(CONTENT_BUNDLES_DIRECTORY, f'{lang}.bundle')
+
+
+def build_content_bundle(lang, filename):
+    """Compile the content of a language into a bundle.
+
+    A bundle starts with BUNDLE_MAGIC and the length of its index. The index is a JSON object with
+    [offset, length, mtime of the YAML file] for every section, followed by the pickled sections. Offsets
+    count from the end of the index.
+
+    Besides the content itself, there is a section with the content translated by deep_translate_keywords
+    for the default keyword language of the language and for English, named like 'adventures.en'.
+    """
+    keyword_langs = sorted({default_keyword_language(lang), 'en'})
+    sections = []
+    for kind in BUNDLED_CONTENT:
+        yaml_filename = f'content/{kind}/{lang}.yaml'
+        if os.path.exists(yaml_filename):
+            data = YamlFile(os.path.abspath(yaml_filename)).load_uncached()
+            mtime = os.stat(yaml_filename).st_mtime
+            sections.append((kind, mtime, pickle.dumps(data, pickle.HIGHEST_PROTOCOL)))
+            for keyword_lang in keyword_langs:
+                translated = deep_translate_keywords(data, keyword_lang)
+                sections.append((f'{kind}.{keyword_lang}', mtime, pickle.dumps(translated, pickle.HIGHEST_PROTOCOL)))
+
+    index = {}
+    offset = 0
+    for kind, mtime, pickled in sections:
+        index[kind] = [offset, len(pickled), mtime]
+        offset += len(pickled)
+    index_bytes = json.dumps(index).encode()
+
+    with atomic_write_file(filename) as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(BUNDLE_INDEX_LENGTH.pack(len(index_bytes)))
+        f.write(index_bytes)
+        for _, _, pickled in sections:
+            f.write(pickled)
+
+
+class ContentBundle:
+    """The compiled content of a language, decoded one section at a time when it is first used."""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError(f'{filename} is not a content bundle')
+        start = len(BUNDLE_MAGIC) + BUNDLE_INDEX_LENGTH.size
+        (index_length,) = BUNDLE_INDEX_LENGTH.unpack_from(self._map, len(BUNDLE_MAGIC))
+        self.index = json.loads(self._map[start:start + index_length])
+        self._data_start = start + index_length
+        self._sections = {}
+
+    def section(self, name, yaml_filename):
+        """Return the data of a section, or None if it isn't in the bundle or the YAML file changed since."""
+        if name not in self._sections:
+            entry = self.index.get(name)
+            if entry is None or file_mtime(yaml_filename) != entry[2]:
+                return None
+            offset = self._data_start + entry[0]
+            self._sections[name] = pickle.loads(memoryview(self._map)[offset:offset + entry[1]])
+        return self._sections[name]
+
+
+def file_mtime(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+CONTENT_BUNDLES = {}
+
+
+def get_content_bundle(lang):
+    """Return the ContentBundle of a language, or None if it has not been built."""
+    if lang not in CONTENT_BUNDLES:
+        try:
+            CONTENT_BUNDLES[lang] = ContentBundle(bundle_filename(lang))
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning('Could not open the content bundle of %s: %s', lang, e)
+            CONTENT_BUNDLES[lang] = None
+    return CONTENT_BUNDLES[lang]
+
+
+def load_bundled_file(filename, keyword_lang=None):
+    """Return the data of content/<kind>/<lang>.yaml from the bundle of the language, or None if we can't.
+
+    With a keyword language, return the data translated for that keyword language if the bundle has it.
+    """
+    # In debug mode we want to see changes to the content right away
+    if is_debug_mode():
+        return None
+    kind = os.path.basename(os.path.dirname(filename))
+    lang = os.path.splitext(os.path.basename(filename))[0]
+    bundle = get_content_bundle(lang) if kind in BUNDLED_CONTENT else None
+    if bundle is None:
+        return None
+    return bundle.section(kind if keyword_lang is None else f'{kind}.{keyword_lang}', filename)
+
+
+# deep_translate_keywords makes a copy of a file with the keywords filled in. We keep the translated copy of
+# every file and keyword language we use (up to about this many bytes), so getting the content of a level
+# for a keyword language is a lookup. The copies are shared between requests, so they must not be changed.
+TRANSLATED_CONTENT_CACHE = BoundedCache(
+    max_bytes=int(os.getenv('HEDY_TRANSLATED_CONTENT_CACHE_BYTES', 64 * 1024 * 1024)))
+
+
+class ContentPerLanguage(dict):
+    """The content objects (like Adventures) of every language, created when a language is first used.
+
+    Languages we don't have get an object of the `missing` class, or a KeyError if there is none.
+    """
+
+    def __init__(self, content_class, missing=None):
+        super().__init__()
+        self.content_class = content_class
+        self.missing = missing
+
+    def __missing__(self, lang):
+        if lang in ALL_LANGUAGES:
+            content = self.content_class(lang)
+        elif self.missing is not None:
+            content = self.missing()
+        else:
+            raise KeyError(lang)
+        self[lang] = content
+        return content
 
 
 class StructuredDataFile:
@@ -268,11 +439,35 @@ class StructuredDataFile:
 
     @property
     def file(self):
-        """Lazily load the requested file."""
-        if not self._file:
+        """Lazily load the requested file, from the content bundle of its language if there is one."""
+        if self._file is None:
+            self._file = load_bundled_file(self.filename)
+        if self._file is None:
             self._file = YamlFile.for_file(self.filename)
         return self._file
 
+    def translated(self, keyword_lang):
+        """The data of the file with the keywords filled in for the given keyword language.
+
+        The translations are cached for as long as the data of the file doesn't change. Keys are not
+        translated, so the content of a level is in the same place as in the file.
+        """
+        if not isinstance(self.file, YamlFile):
+            # the file comes from a content bundle, which may have the translation as well
+            translated = load_bundled_file(self.filename, keyword_lang)
+            if translated is not None:
+                return translated
+
+        source = self.file.access() if isinstance(self.file, YamlFile) else self.file
+        key = (self.filename, keyword_lang)
+        cached = TRANSLATED_CONTENT_CACHE.get(key)
+        if cached is not None and cached[0] is source:
+            return cached[1]
+        translated = deep_translate_keywords(source, keyword_lang)
+        size = os.path.getsize(self.filename) * YAML_BYTES_PER_FILE_BYTE if os.path.exists(self.filename) else 0
+        TRANSLATED_CONTENT_CACHE.put(key, (source, translated), size)
+        return translated
+
 
 class Commands(StructuredDataFile):
     def __init__(self, language):
@@ -280,7 +475,7 @@ class Commands(StructuredDataFile):
         super().__init__(f'content/cheatsheets/{self.language}.yaml')
 
     def get_commands_for_level(self, level, keyword_lang):
-        return deep_translate_keywords(self.file.get(int(level), {}), keyword_lang)
+        return self.translated(keyword_lang).get(int(level), {})
 
 
 def deep_translate_keywords(yaml, keyword_language):
@@ -317,12 +512,63 @@ class Adventures(StructuredDataFile):
         return {aid: adv['name'] for aid, adv in self.file.get('adventures', {}).items()}
 
     def get_adventures(self, keyword_lang="en"):
-        return deep_translate_keywords(self.file.get('adventures'), keyword_lang)
+        return self.translated(keyword_lang).get('adventures')
+
+    def get_adventures_for_level(self, level, keyword_lang="en"):
+        """The adventures of a level as the code page shows them, in the order of ADVENTURE_ORDER_PER_LEVEL.
+
+        The adventures are shared between requests, so they must not be changed: copy an adventure to add
+        something to it.
+        """
+        translated = self.translated(keyword_lang)
+        key = (self.filename, keyword_lang, level)
+        cached = ADVENTURE_VIEWS_CACHE.get(key)
+        if cached is not None and cached[0] is translated:
+            return cached[1]
+
+        adventures = translated.get('adventures') or {}
+
+        order = {short_name: i for i, short_name in enumerate(ADVENTURE_ORDER_PER_LEVEL.get(level, []))}
+        views = tuple(sorted((adventure_view(short_name, adventure, level)
+                              for short_name, adventure in adventures.items() if level in adventure['levels']),
+                             key=lambda view: order.get(view['short_name'], len(order))))
+        ADVENTURE_VIEWS_CACHE.put(key, (translated, views), ADVENTURE_VIEW_BYTES * len(views))
+        return views
 
     def has_adventures(self):
         return True if self.file.get('adventures') else False
 
 
+# The adventures of a level for every language and keyword language that is used. The texts in the views are
+# those of the translated content, so a view itself only takes a few hundred bytes.
+ADVENTURE_VIEWS_CACHE = BoundedCache(max_bytes=int(os.getenv('HEDY_ADVENTURE_VIEWS_CACHE_BYTES', 16 * 1024 * 1024)))
+ADVENTURE_VIEW_BYTES = 512
+
+
+def adventure_view(short_name, adventure, level):
+    content = adventure['levels'][level]
+    view = {
+        'short_name': short_name,
+        'name': adventure['name'],
+        'image': adventure.get('image', None),
+        'default_save_name': adventure.get('default_save_name', adventure['name']),
+        'text': content.get('story_text', ""),
+        'example_code': content.get('example_code', ""),
+        'start_code': content.get('start_code', ""),
+    }
+    # Sometimes we have multiple text and example_code -> iterate these and add as well!
+    extra_stories = []
+    for i in range(2, 10):
+        if not content.get('story_text_' + str(i)):
+            break
+        extra_story = {'text': content.get('story_text_' + str(i))}
+        if content.get('example_code_' + str(i)):
+            extra_story['example_code'] = content.get('example_code_' + str(i))
+        extra_stories.append(extra_story)
+    view['extra_stories'] = tuple(extra_stories)
+    return view
+
+
 class NoSuchAdventure:
     def get_adventure(self):
         return {}
@@ -337,10 +583,10 @@ class ParsonsProblem(StructuredDataFile):
         return max(int(lnum) for lnum in self.file.get('levels', {}).get(level, {}).keys())
 
     def get_parsons_data_for_level(self, level, keyword_lang="en"):
-        return deep_translate_keywords(self.file.get('levels', {}).get(level, None), keyword_lang)
+        return self.translated(keyword_lang).get('levels', {}).get(level, None)
 
     def get_parsons_data_for_level_exercise(self, level, excercise, keyword_lang="en"):
-        return deep_translate_keywords(self.file.get('levels', {}).get(level, {}).get(excercise), keyword_lang)
+        return self.translated(keyword_lang).get('levels', {}).get(level, {}).get(excercise)
 
 
 class Quizzes(StructuredDataFile):
@@ -352,10 +598,10 @@ class Quizzes(StructuredDataFile):
         return max(int(k) for k in self.file.get('levels', {}).get(level, {}))
 
     def get_quiz_data_for_level(self, level, keyword_lang="en"):
-        return deep_translate_keywords(self.file.get('levels', {}).get(level), keyword_lang)
+        return self.translated(keyword_lang).get('levels', {}).get(level)
 
     def get_quiz_data_for_level_question(self, level, question, keyword_lang="en"):
-        return deep_translate_keywords(self.file.get('levels', {}).get(level, {}).get(question), keyword_lang)
+        return self.translated(keyword_lang).get('levels', {}).get(level, {}).get(question)
 
 
 class NoSuchQuiz:
@@ -373,12 +619,12 @@ class Tutorials(StructuredDataFile):
     def get_tutorial_for_level(self, level, keyword_lang="en"):
         if level not in ["intro", "teacher"]:
             level = int(level)
-        return deep_translate_keywords(self.file.get(level, None), keyword_lang)
+        return self.translated(keyword_lang).get(level, None)
 
     def get_tutorial_for_level_step(self, level, step, keyword_lang="en"):
         if level not in ["intro", "teacher"]:
             level = int(level)
-        return deep_translate_keywords(self.file.get(level, {}).get('steps', {}).get(step), keyword_lang)
+        return self.translated(keyword_lang).get(level, {}).get('steps', {}).get(step)
 
 
 class NoSuchTutorial:
@@ -392,7 +638,7 @@ class Slides(StructuredDataFile):
         super().__init__(f'content/slides/{self.language}.yaml')
 
     def get_slides_for_level(self, level, keyword_lang="en"):
-        return deep_translate_keywords(self.file.get('levels', {}).get(level), keyword_lang)
+        return self.translated(keyword_lang).get('levels', {}).get(level)
 
 
 class NoSuchSlides:
@@ -2,9 +2,9 @@ from collections import namedtuple
 from lark import Visitor, Token
 import hedy
 import operator
-import yaml
-from os import path
+import regex
 import hedy_content
+import keyword_registry
 
 # Holds the token that needs to be translated, its line number, start and
 # end indexes and its value (e.g. ", ").
@@ -13,23 +13,12 @@ Rule = namedtuple("Rule", "keyword line start end value")
 
 def keywords_to_dict(lang="nl"):
     """ "Return a dictionary of keywords from language of choice. Key is english value is lang of choice"""
-    base = path.abspath(path.dirname(__file__))
-
-    keywords_path = "content/keywords/"
-    yaml_filesname_with_path = path.join(base, keywords_path, lang + ".yaml")
-
-    with open(yaml_filesname_with_path, "r", encoding="UTF-8") as stream:
-        command_combinations = yaml.safe_load(stream)
-
-    for k, v in command_combinations.items():
-        command_combinations[k] = v.split("|")
-
-    return command_combinations
+    spellings = keyword_registry.get_language(lang).spellings
+    return {k: list(v) for (k, v) in spellings.items()}
 
 
 def keywords_to_dict_single_choice(lang):
-    command_combinations = keywords_to_dict(lang)
-    return {k: v[0] for (k, v) in command_combinations.items()}
+    return dict(keyword_registry.get_language(lang).defaults)
 
 
 def all_keywords_to_dict():
@@ -45,21 +34,12 @@ def all_keywords_to_dict():
 
 def translate_keyword_from_en(keyword, lang="en"):
     # translated the keyword to a local lang
-    local_keywords = keywords_to_dict(lang)
-    if keyword in local_keywords.keys():
-        local_keyword = local_keywords[keyword][0]
-    else:
-        local_keyword = keyword
-    return local_keyword
+    return keyword_registry.keyword_from_en(keyword, lang)
 
 
 def translate_keyword_to_en(keyword, lang):
     # translated the keyword to from a local lang
-    original_keywords = keywords_to_dict(lang)
-    for k, v in original_keywords.items():
-        if keyword in v:
-            return k
-    return keyword
+    return keyword_registry.keyword_to_en(keyword, lang)
 
 
 def get_target_keyword(keyword_dict, keyword):
@@ -76,15 +56,18 @@ def translate_keywords(input_string_, from_lang="en", to_lang="nl", level=1):
             input_string_, level, from_lang, escape_backslashes=False
         )
 
-        parser = hedy.get_parser(level, from_lang, True)
-        keyword_dict_from = keywords_to_dict(from_lang)
-        keyword_dict_to = keywords_to_dict(to_lang)
+        keyword_dict_from = keyword_registry.get_language(from_lang).spellings
+        keyword_dict_to = keyword_registry.get_language(to_lang).spellings
 
-        program_root = parser.parse(processed_input + "\n").children[0]
+        rules = find_keyword_rules(processed_input, from_lang, to_lang, level)
+        if rules is None:
+            parser = hedy.get_parser(level, from_lang, True)
+            program_root = parser.parse(processed_input + "\n").children[0]
 
-        translator = Translator(processed_input)
-        translator.visit(program_root)
-        ordered_rules = reversed(sorted(translator.rules, key=operator.attrgetter("line", "start")))
+            translator = Translator(processed_input)
+            translator.visit(program_root)
+            rules = translator.rules
+        ordered_rules = reversed(sorted(rules, key=operator.attrgetter("line", "start")))
 
         # FH Feb 2022 TODO trees containing invalid nodes are happily translated,
         # should be stopped here!
@@ -108,6 +91,215 @@ def translate_keywords(input_string_, from_lang="en", to_lang="nl", level=1):
         return input_string_
 
 
+# Translating keywords doesn't need a parse tree in most programs: from level 4 on, text is quoted, so we can find
+# the keywords with a tokenizer. The tokenizer returns the same rules as the Translator, and gives up (so we parse
+# the program after all) when it can't be sure a word is a keyword that the Translator would translate. That
+# includes every line with a value that isn't quoted text, a number or a variable: it might be unquoted text,
+# whose words the parser leaves alone even when they are keywords.
+KEYWORD_RULES_MIN_LEVEL = 4
+
+# The keywords the Translator translates, with the token they are in
+KEYWORD_TOKENS = {
+    'print': '_PRINT', 'ask': '_ASK', 'echo': '_ECHO', 'color': '_COLOR', 'forward': '_FORWARD', 'turn': '_TURN',
+    'sleep': '_SLEEP', 'add': '_ADD_LIST', 'to_list': '_TO_LIST', 'remove': '_REMOVE', 'from': '_FROM',
+    'if': '_IF', 'else': '_ELSE', 'elif': '_ELIF', 'is': '_IS', 'in': '_IN', 'at': '_AT', 'repeat': '_REPEAT',
+    'times': '_TIMES', 'for': '_FOR', 'range': '_RANGE', 'to': '_TO', 'while': '_WHILE', 'and': '_AND',
+    'or': '_OR', 'input': '_INPUT'}
+
+# Keywords that are only translated right after another keyword (or bracket): turn left, at random, list[random]
+CONTEXT_KEYWORDS = {'left': {'turn'}, 'right': {'turn'}, 'random': {'at', '['}}
+
+# Keywords that are spelled the same in some languages, told apart by the keyword that comes before them in the line
+OPENING_KEYWORDS = {'to_list': 'add', 'from': 'remove', 'to': 'range'}
+
+# Keywords that are followed by a name or a value, with the keywords that may come right after them instead. Any
+# other keyword there could just as well be the name of a variable.
+VALUE_KEYWORDS = {
+    'is': {'ask', 'input'}, 'at': {'random'}, 'in': {'range'}, 'turn': {'left', 'right'}, 'for': set(),
+    'add': set(), 'to_list': set(), 'remove': set(), 'from': set(), 'if': set(), 'elif': set(), 'while': set(),
+    'and': set(), 'or': set(), 'repeat': set(), 'range': set(), 'to': set(), 'print': set(), 'ask': set(),
+    'forward': set(), 'color': set(), 'sleep': set()}
+
+# Commands that can be used without a value
+COMMANDS_WITHOUT_VALUE = {'print', 'sleep', 'forward', 'turn', 'color'}
+
+# Keywords that start a statement. A line that starts with anything else (other than an assignment) is probably
+# not a valid statement, and the parser decides what to do with it.
+STATEMENT_KEYWORDS = {'print', 'ask', 'echo', 'forward', 'turn', 'color', 'sleep', 'add', 'remove', 'if', 'else',
+                      'elif', 'repeat', 'for', 'while'}
+
+# Keywords whose statements the Translator skips, so a line that has them is left to the parser
+UNTRANSLATED_KEYWORDS = {'pressed', 'button'}
+
+COMMAS = {',', '،', '，'}
+LETTER = r'[\p{L}\p{M}\p{N}_]'
+
+KeywordTokenizer = namedtuple('KeywordTokenizer', ['pattern', 'keywords_of_spelling'])
+KEYWORD_TOKENIZERS = {}
+
+
+def get_keyword_tokenizer(lang):
+    """Return a regex that splits a line of a program in quoted text, comments, keywords, words and punctuation,
+    and the keywords every spelling can be.
+
+    The keywords are every spelling of every keyword in the language and in English, since programs can use both.
+    """
+    if lang not in KEYWORD_TOKENIZERS:
+        keywords_of_spelling = {}
+        for language in [keyword_registry.get_language(lang), keyword_registry.get_language('en')]:
+            for keyword, spellings in language.spellings.items():
+                for spelling in spellings:
+                    keywords_of_spelling.setdefault(spelling, set()).add(keyword)
+        # longer spellings first, so that `not in` is found before `in`
+        spellings = sorted((s for s in keywords_of_spelling if s not in COMMAS), key=len, reverse=True)
+        keywords = '|'.join(regex.escape(s) for s in spellings)
+        pattern = regex.compile(
+            r"""(?P<quoted>'(?:[^\\']|\\.)*'|"(?:[^\\"]|\\.)*")|(?P<comment>#.*)|(?P<quote>['"`])"""
+            f"|(?P<keyword>(?<!{LETTER})(?:{keywords})(?!{LETTER}))|(?P<word>{LETTER}+)"
+            r"""|(?P<punctuation>[^\s'"#])""")
+        KEYWORD_TOKENIZERS[lang] = KeywordTokenizer(pattern, keywords_of_spelling)
+    return KEYWORD_TOKENIZERS[lang]
+
+
+def find_keyword_rules(code, from_lang, to_lang, level):
+    """Return the rules the Translator finds in a program, using a keyword tokenizer instead of the parser.
+
+    Returns None when a keyword might also be a variable name or a text value, or when we can't otherwise be sure,
+    and then the program has to be parsed. The tokenizer doesn't know whether a program is valid, so unlike the
+    parser it also translates the keywords of programs with errors.
+    """
+    if level < KEYWORD_RULES_MIN_LEVEL:
+        return None
+    lines = code.split('\n')
+    # the rules are applied to the lines of str.splitlines
+    if lines != (code + '\n').splitlines():
+        return None
+
+    tokenizer = get_keyword_tokenizer(from_lang)
+    terminals = get_grammar_terminals(level, from_lang)
+    same_commas = (keyword_registry.get_language(from_lang).spellings.get('comma')
+                   == keyword_registry.get_language(to_lang).spellings.get('comma'))
+    rules = []
+    # the variables the lines so far define
+    variables = set()
+    for line_number, line in enumerate(lines, start=1):
+        # a token is (keyword, kind, value, start, end), the keyword is None for anything but a keyword we translate
+        tokens = []
+        for match in tokenizer.pattern.finditer(line):
+            kind, value = match.lastgroup, match.group()
+            if kind == 'comment':
+                break
+            if kind == 'quote':
+                # a quote without its closing quote, or a backtick of markdown
+                return None
+            if kind == 'punctuation' and value in COMMAS:
+                # only the commas between list items are translated
+                if not same_commas:
+                    return None
+                continue
+            keyword = None
+            if kind == 'keyword':
+                keywords = tokenizer.keywords_of_spelling[value]
+                if keywords & UNTRANSLATED_KEYWORDS:
+                    return None
+                translated = {k for k in keywords if k in KEYWORD_TOKENS or k in CONTEXT_KEYWORDS}
+                keywords = {k for k in translated if k in CONTEXT_KEYWORDS or KEYWORD_TOKENS[k] in terminals}
+                if translated and not keywords:
+                    # a keyword of another level, which the parser might see as text or as an error
+                    return None
+                if len(keywords) > 1:
+                    opened = {k for k in keywords if OPENING_KEYWORDS.get(k) in [token[0] for token in tokens]}
+                    if len(opened) != 1 or not keywords <= OPENING_KEYWORDS.keys():
+                        return None
+                    keywords = opened
+                keyword = next(iter(keywords), None)
+            tokens.append((keyword, kind, value, match.start(), match.end()))
+
+        line_rules = find_keyword_rules_in_line(tokens, line_number, level, variables)
+        if line_rules is None:
+            return None
+        rules += line_rules
+    return rules
+
+
+def find_keyword_rules_in_line(tokens, line_number, level, variables):
+    if not tokens:
+        return []
+    # what a token is to the tokens around it: its keyword, a punctuation character, or None for a word or text
+    roles = [keyword or (value if kind == 'punctuation' else None) for keyword, kind, value, _, _ in tokens]
+    # in an assignment (before level 12 the value can be unquoted text) only a few keywords can follow the `is`
+    assignment = len(tokens) > 1 and tokens[0][1] == 'word' and roles[1] in ['is', '=']
+    if not assignment and roles[0] not in STATEMENT_KEYWORDS and not (len(tokens) > 1 and roles[1] == '['):
+        return None
+    if not has_only_known_values(tokens, roles, assignment, variables):
+        return None
+    rules = []
+    for index, (keyword, _, value, start, end) in enumerate(tokens):
+        if keyword is None:
+            continue
+        previous = roles[index - 1] if index > 0 else None
+        if keyword in CONTEXT_KEYWORDS:
+            if previous not in CONTEXT_KEYWORDS[keyword]:
+                return None
+        elif previous in VALUE_KEYWORDS and keyword not in VALUE_KEYWORDS[previous]:
+            return None
+        following = roles[index + 1] if index + 1 < len(tokens) else None
+        # a keyword followed by `is` or `=` is a variable that is assigned
+        if keyword != 'is' and following in ['is', '=']:
+            return None
+        # without its value (like `for ... in range`), this is probably not a program
+        if keyword in VALUE_KEYWORDS and keyword not in COMMANDS_WITHOUT_VALUE and (
+                index + 1 == len(tokens) or following not in [None, '(', '[', '-', *VALUE_KEYWORDS[keyword]]):
+            return None
+        if assignment and index > 1 and keyword not in {'ask', 'input', 'at', 'random'}:
+            return None
+        rules.append(Rule(keyword, line_number, start, end - 1, value))
+    # before level 12, a condition like `if name is Hedy Lamarr print` compares with a text that has spaces
+    if level < 12 and any(role in ['if', 'elif', 'while'] for role in roles) and has_text_with_spaces(roles):
+        return None
+    return rules
+
+
+def has_only_known_values(tokens, roles, assignment, variables):
+    """Return whether every value in the line is quoted text, a number, a color or a variable.
+
+    Adds the variables the line defines to the variables.
+    """
+    for index, (_, kind, value, _, _) in enumerate(tokens):
+        if roles[index] is not None or kind == 'quoted' or value.isdigit():
+            continue
+        previous = roles[index - 1] if index > 0 else None
+        if (assignment and index == 0) or previous == 'for':
+            variables.add(value)
+        elif value not in variables and not (kind == 'keyword' and previous == 'color'):
+            return False
+    return True
+
+
+def has_text_with_spaces(roles):
+    words = None
+    for role in roles:
+        if role in ['is', 'in', '=']:
+            words = 0
+        elif role is None and words is not None:
+            words += 1
+            if words > 1:
+                return True
+        else:
+            words = None
+    return False
+
+
+GRAMMAR_TERMINALS = {}
+
+
+def get_grammar_terminals(level, lang):
+    key = (level, lang)
+    if key not in GRAMMAR_TERMINALS:
+        GRAMMAR_TERMINALS[key] = frozenset(t.name for t in hedy.get_parser(level, lang, True).terminals)
+    return GRAMMAR_TERMINALS[key]
+
+
 def replace_line(lines, index, line):
     before = "\n".join(lines[0:index])
     after = "\n".join(lines[index + 1:])
@@ -286,10 +478,11 @@ class Translator(Visitor):
         self.add_rule("_WHILE", "while", tree)
 
     def and_condition(self, tree):
-        self.add_rule("_AND", "and", tree)
+        # a and b and c is a single and_condition
+        self.add_rules("_AND", "and", tree)
 
     def or_condition(self, tree):
-        self.add_rule("_OR", "or", tree)
+        self.add_rules("_OR", "or", tree)
 
     def input(self, tree):
         self.add_rule("_IS", "is", tree)
@@ -310,6 +503,13 @@ class Translator(Visitor):
             )
             self.rules.append(rule)
 
+    def add_rules(self, token_name, token_keyword, tree):
+        for token in self.get_keyword_tokens(token_name, tree):
+            rule = Rule(
+                token_keyword, token.line, token.column - 1, token.end_column - 2, token.value
+            )
+            self.rules.append(rule)
+
     def get_keyword_token(self, token_type, node):
         for c in node.children:
             if type(c) is Token and c.type == token_type:
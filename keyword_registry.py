@@ -0,0 +1,66 @@
+"""The keywords of every keyword language, read from content/keywords when a language is first used.
+
+A keyword can have several spellings in a language, separated by | in the YAML file (`repeat: répète|repete`).
+The first spelling is the one we use when we write a keyword in that language, all of them are understood.
+"""
+import os
+from os import path
+
+from website.yaml_file import YamlFile
+
+KEYWORDS_DIRECTORY = path.join(path.abspath(path.dirname(__file__)), 'content', 'keywords')
+
+
+class KeywordLanguage:
+    """The keywords of a single language, looked up by English keyword or by any of their spellings."""
+
+    def __init__(self, lang, yaml_dict):
+        self.lang = lang
+        # English keyword -> tuple of spellings, the default first. YAML reads some spellings (like `1` or `yes`)
+        # as numbers or booleans, we want their text.
+        self.spellings = {keyword: tuple(str(value).split('|')) for keyword, value in yaml_dict.items()}
+        # English keyword -> default spelling
+        self.defaults = {keyword: spellings[0] for keyword, spellings in self.spellings.items()}
+        # any spelling -> English keyword. If a spelling is used for several keywords (like `is` and `=` in some
+        # languages), the first keyword in the file wins.
+        self.to_en = {}
+        for keyword, spellings in self.spellings.items():
+            for spelling in spellings:
+                self.to_en.setdefault(spelling, keyword)
+
+
+# The languages we have read the keywords of, and the languages that have a keywords file
+LANGUAGES = {}
+LANGUAGE_CODES = None
+
+
+def language_codes():
+    global LANGUAGE_CODES
+    if LANGUAGE_CODES is None:
+        LANGUAGE_CODES = frozenset(path.splitext(filename)[0] for filename in os.listdir(KEYWORDS_DIRECTORY)
+                                   if filename.endswith('.yaml'))
+    return LANGUAGE_CODES
+
+
+def get_language(lang):
+    """Return the KeywordLanguage of a language. Raises a KeyError if the language has no keywords file."""
+    if lang not in LANGUAGES:
+        if lang not in language_codes():
+            raise KeyError(lang)
+        yaml_dict = YamlFile.for_file(path.join(KEYWORDS_DIRECTORY, f'{lang}.yaml')).to_dict()
+        LANGUAGES[lang] = KeywordLanguage(lang, yaml_dict)
+    return LANGUAGES[lang]
+
+
+def has_language(lang):
+    return lang in language_codes()
+
+
+def keyword_from_en(keyword, lang):
+    """Return the default spelling of an English keyword in a language, or the keyword itself if it has none."""
+    return get_language(lang).defaults.get(keyword, keyword)
+
+
+def keyword_to_en(word, lang):
+    """Return the English keyword of any spelling of a keyword in a language, or the word itself if it is none."""
+    return get_language(lang).to_en.get(word, word)
@@ -0,0 +1,69 @@
+"""Run transpiled Hedy programs in this process, like the tests and the embroidery machine files do.
+
+The prefixes that define the helpers of Hedy programs are compiled once, and the code objects of programs are
+kept in an LRU cache keyed by the hash of their source, so running the same program again only executes it.
+Every run gets a fresh namespace, so programs can't see each other's variables.
+"""
+import contextlib
+import hashlib
+import io
+import os
+
+import utils
+from bounded_cache import BoundedCache
+
+# Code objects are a few times larger than their source, this is a rough estimate of their size.
+CODE_BYTES_PER_CHARACTER = 8
+CODE_CACHE = BoundedCache(max_bytes=int(os.getenv('HEDY_PROGRAM_CODE_CACHE_BYTES', 16 * 1024 * 1024)))
+
+# Programs that run longer than this many seconds are stopped (0 disables the time limit).
+PROGRAM_TIME_LIMIT = float(os.getenv('HEDY_PROGRAM_TIME_LIMIT', 10))
+
+NORMAL_PREFIX = compile(utils.NORMAL_PREFIX_CODE, '<normal prefix>', 'exec')
+TURTLE_PREFIX = compile(utils.TURTLE_PREFIX_CODE, '<turtle prefix>', 'exec')
+# the pygame prefix uses os, which the frontend has imported by the time it runs
+PYGAME_PREFIX = compile('import os\n' + utils.PYGAME_PREFIX_CODE, '<pygame prefix>', 'exec')
+
+
+class ProgramTimeoutError(Exception):
+    def __init__(self, time_limit):
+        super().__init__(f'The program ran longer than {time_limit} seconds')
+        self.time_limit = time_limit
+
+
+def prefixes_for(parse_result):
+    """The prefixes a transpiled program needs, in the order they have to run."""
+    prefixes = [NORMAL_PREFIX]
+    if parse_result.has_turtle:
+        prefixes.append(TURTLE_PREFIX)
+    if parse_result.has_pygame:
+        prefixes.append(PYGAME_PREFIX)
+    return prefixes
+
+
+def compile_program(source):
+    key = hashlib.md5(source.encode('utf-8')).hexdigest()
+    code = CODE_CACHE.get(key)
+    if code is None:
+        code = compile(source, '<program>', 'exec')
+        CODE_CACHE.put(key, code, len(source) * CODE_BYTES_PER_CHARACTER)
+    return code
+
+
+def run_program(source, prefixes=(), namespace=None, time_limit=None):
+    """Run a program after the given prefixes, and return what it printed to stdout and stderr.
+
+    The program runs in a fresh namespace, with the variables in `namespace` already defined. Exceptions of the
+    program are raised, and a ProgramTimeoutError when it runs longer than the time limit.
+    """
+    code = compile_program(source)
+    namespace = dict(namespace or {}, __name__='__main__')
+    time_limit = PROGRAM_TIME_LIMIT if time_limit is None else time_limit
+    out, err = io.StringIO(), io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        # wall-clock time, so programs that sleep forever are stopped as well
+        with utils.time_limit(time_limit, lambda: ProgramTimeoutError(time_limit)):
+            for prefix in prefixes:
+                exec(prefix, namespace)
+            exec(code, namespace)
+    return out.getvalue(), err.getvalue()
@@ -3,13 +3,10 @@ import hashlib
 import hedy
 import hedy_translation
 import re
-import sys
-import io
 import os
-from contextlib import contextmanager
 import inspect
 import unittest
-import utils
+import program_runner
 from hedy_content import ALL_KEYWORD_LANGUAGES, KEYWORDS
 import pickle
 
@@ -78,33 +75,12 @@ class HedyTester(unittest.TestCase):
         hash_language_plus_snippet_and_level = self.create_hash(self.all_language_texts, snippet, level)
         return hash_language_plus_snippet_and_level in self.snippet_hashes
 
-    @staticmethod
-    @contextmanager
-    def captured_output():
-        new_out, new_err = io.StringIO(), io.StringIO()
-        old_out, old_err = sys.stdout, sys.stderr
-        try:
-            sys.stdout, sys.stderr = new_out, new_err
-            yield sys.stdout, sys.stderr
-        finally:
-            sys.stdout, sys.stderr = old_out, old_err
-
     @staticmethod
     def run_code(parse_result):
-        code = utils.NORMAL_PREFIX_CODE
-
-        if parse_result.has_turtle:
-            code += utils.TURTLE_PREFIX_CODE
-        if parse_result.has_pygame:
-            code += utils.PYGAME_PREFIX_CODE
-
-        code += parse_result.code
         # remove sleep comments to make program execution less slow
-        code = re.sub(r'time\.sleep\([^\n]*\)', 'pass', code)
-
-        with HedyTester.captured_output() as (out, err):
-            exec(code)
-        return out.getvalue().strip()
+        code = re.sub(r'time\.sleep\([^\n]*\)', 'pass', parse_result.code)
+        output, _ = program_runner.run_program(code, program_runner.prefixes_for(parse_result))
+        return output.strip()
 
     def name(self):
         return inspect.stack()[1][3]
@@ -226,6 +202,7 @@ class HedyTester(unittest.TestCase):
                         self.assert_translated_code_equal(code, back_in_org)
 
                 all_commands = hedy.all_commands(code, level, lang)
+                self.assertEqual(all_commands, list(result.commands))
                 if expected_commands is not None:
                     self.assertEqual(expected_commands, all_commands)
                 # <- use this to run tests locally with unittest
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+
+import hedy_content
+from website.yaml_file import YamlFile
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+class InRootDirectory(unittest.TestCase):
+    """Content files are found relative to the working directory, which other tests (like the snippet tests) change."""
+
+    def setUp(self):
+        self.working_directory = os.getcwd()
+        os.chdir(ROOT_DIR)
+
+    def tearDown(self):
+        os.chdir(self.working_directory)
+
+
+class TestContentBundle(InRootDirectory):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'nl.bundle')
+        hedy_content.build_content_bundle('nl', self.filename)
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    def test_sections_are_the_yaml_data(self):
+        bundle = hedy_content.ContentBundle(self.filename)
+
+        for kind in hedy_content.BUNDLED_CONTENT:
+            yaml_filename = f'content/{kind}/nl.yaml'
+            self.assertEqual(YamlFile(os.path.abspath(yaml_filename)).load_uncached(),
+                             bundle.section(kind, yaml_filename), kind)
+
+    def test_translated_sections_for_default_keyword_languages(self):
+        bundle = hedy_content.ContentBundle(self.filename)
+        data = bundle.section('adventures', 'content/adventures/nl.yaml')
+
+        self.assertEqual(hedy_content.deep_translate_keywords(data, 'en'),
+                         bundle.section('adventures.en', 'content/adventures/nl.yaml'))
+        self.assertNotIn('adventures.nl', bundle.index)
+
+    def test_changed_yaml_file_is_not_read_from_the_bundle(self):
+        bundle = hedy_content.ContentBundle(self.filename)
+        bundle.index['quizzes'][2] -= 1
+
+        self.assertIsNone(bundle.section('quizzes', 'content/quizzes/nl.yaml'))
+
+    def test_other_files_are_not_bundles(self):
+        with self.assertRaises(ValueError):
+            hedy_content.ContentBundle('content/quizzes/nl.yaml')
+
+
+class TestTranslatedContent(InRootDirectory):
+    def setUp(self):
+        super().setUp()
+        hedy_content.TRANSLATED_CONTENT_CACHE.clear()
+
+    def test_translation_is_cached(self):
+        adventures = hedy_content.Adventures('nl')
+        translated = adventures.get_adventures('nl')
+
+        self.assertIs(translated, hedy_content.Adventures('nl').get_adventures('nl'))
+        self.assertEqual(hedy_content.deep_translate_keywords(YamlFile.for_file(adventures.filename)['adventures'],
+                                                              'nl'), translated)
+
+    def test_levels_are_translated_like_the_whole_file(self):
+        commands = hedy_content.Commands('nl')
+
+        self.assertEqual(hedy_content.deep_translate_keywords(YamlFile.for_file(commands.filename)[3], 'nl'),
+                         commands.get_commands_for_level(3, 'nl'))
+
+
+class TestAdventureViews(InRootDirectory):
+    def test_adventures_are_in_the_order_of_the_level(self):
+        adventures = hedy_content.Adventures('en').get_adventures_for_level(4, 'en')
+        order = hedy_content.ADVENTURE_ORDER_PER_LEVEL[4]
+
+        names = [adventure['short_name'] for adventure in adventures]
+        self.assertEqual([name for name in order if name in names], names[:len(set(order) & set(names))])
+
+    def test_views_are_reused(self):
+        adventures = hedy_content.Adventures('en')
+
+        self.assertIs(adventures.get_adventures_for_level(4, 'nl'), adventures.get_adventures_for_level(4, 'nl'))
+        self.assertIsNot(adventures.get_adventures_for_level(4, 'nl'), adventures.get_adventures_for_level(5, 'nl'))
+
+    def test_file_without_adventures_has_no_adventures(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                self.assertEqual((), hedy_content.Adventures('en').get_adventures_for_level(4, 'en'))
+            finally:
+                os.chdir(ROOT_DIR)
+
+
+class TestContentPerLanguage(unittest.TestCase):
+    def test_content_is_created_once_per_language(self):
+        adventures = hedy_content.ContentPerLanguage(hedy_content.Adventures, hedy_content.NoSuchAdventure)
+
+        self.assertIsInstance(adventures['nl'], hedy_content.Adventures)
+        self.assertIs(adventures['nl'], adventures['nl'])
+        self.assertIsInstance(adventures['xx'], hedy_content.NoSuchAdventure)
+
+    def test_languages_we_dont_have_without_missing_class(self):
+        with self.assertRaises(KeyError):
+            hedy_content.ContentPerLanguage(hedy_content.ParsonsProblem)['xx']
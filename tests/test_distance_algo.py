@@ -124,3 +124,22 @@ class TestsKeywordSuggestions(unittest.TestCase):
         keywords = hedy.get_suggestions_for_language('en', level)
         closest = hedy.closest_command(mistake, keywords)
         self.assertEqual(correct, closest)
+
+    @parameterized.expand([
+        ('print', 'pnirt'),
+        ('sleep', 'sleepb'),
+        ('echo', 'eechooooooo'),
+        ('', 'ask'),
+        ('forward', 'fw'),
+    ])
+    def test_bounded_distance(self, s1, s2):
+        distance = hedy.calculate_minimum_distance(s1, s2)
+        for max_distance in range(6):
+            expected = distance if distance <= max_distance else max_distance + 1
+            self.assertEqual(expected, hedy.calculate_minimum_distance(s1, s2, max_distance))
+
+    def test_suggestions_are_deduplicated_in_order(self):
+        keywords = hedy.get_suggestions_for_language('nl', 1)
+        self.assertEqual(len(set(keywords)), len(keywords))
+        self.assertEqual(keywords, hedy.get_suggestions_for_language('nl', 1))
+        self.assertLess(keywords.index('vraag'), keywords.index('ask'))
@@ -0,0 +1,34 @@
+import unittest
+
+import hedy
+
+
+def indent(s, spaces_amount=2):
+    # how blocks used to be indented
+    return '\n'.join([' ' * spaces_amount + line for line in s.split('\n')])
+
+
+class TestGeneratedCode(unittest.TestCase):
+    def test_nested_blocks_are_indented_like_text(self):
+        inner = hedy.join_code('\n', [hedy.IndentedCode('print(i)', 2), hedy.IndentedCode('x = 1\ny = 2', 2)])
+        outer = "for i in range(3):\n" + inner
+        code = "if x:\n" + hedy.join_code('\n', [hedy.IndentedCode(outer, 2), hedy.IndentedCode('', 4)])
+
+        expected_outer = "for i in range(3):\n" + '\n'.join([indent('print(i)'), indent('x = 1\ny = 2')])
+        expected = "if x:\n" + '\n'.join([indent(expected_outer), indent('', 4)])
+        self.assertEqual(expected, str(code))
+        self.assertEqual(expected, f'{code}')
+
+    def test_join_of_strings_is_a_string(self):
+        self.assertEqual('a\nb', hedy.join_code('\n', ['a', 'b']))
+
+    def test_last_word(self):
+        code = hedy.IndentedCode(hedy.GeneratedCode('time.', 'sleep(0.1)'), 2)
+        self.assertEqual('time.sleep(0.1)', hedy.last_word(code))
+        self.assertEqual('sleep(0.1)', hedy.last_word('print' + hedy.IndentedCode('sleep(0.1)', 2)))
+        self.assertEqual('x', hedy.last_word("print(x)\n" + hedy.IndentedCode('x', 2)))
+
+    def test_sleep_is_not_added_twice(self):
+        body = hedy.IndentedCode('t.forward(10)\ntime.sleep(0.1)', 2)
+        self.assertIs(body, hedy.sleep_after(body))
+        self.assertEqual('  print(x)\n  time.sleep(0.1)', str(hedy.sleep_after(hedy.IndentedCode('print(x)', 2))))
@@ -0,0 +1,82 @@
+import unittest
+
+from lark import Token, Tree
+
+import exceptions
+import hedy
+from tests.Tester import HedyTester
+from website import querylog
+
+
+def fingerprint(tree):
+    # Trees compare tokens only by value, but we also care about their type and position
+    if isinstance(tree, Tree):
+        return str(tree.data), [fingerprint(child) for child in tree.children]
+    if isinstance(tree, Token):
+        return tree.type, str(tree), tree.line, tree.column
+    return tree
+
+
+class TestIncrementalParse(unittest.TestCase):
+    level = 5
+    code = HedyTester.dedent(
+        "naam is ask 'hoe heet jij?'",
+        "if naam is Hedy print 'leuk'",
+        "else print 'minder leuk'",
+        "print 'hallo ' naam")
+
+    def setUp(self):
+        hedy.PARSE_STATE_CACHE.clear()
+        self.record = querylog.LogRecord()
+        querylog.THREAD_LOCAL.current_log_record = self.record
+
+    def tearDown(self):
+        querylog.THREAD_LOCAL.current_log_record = querylog.NullRecord()
+
+    def parse(self, code, session_id=None):
+        return fingerprint(hedy.parse_input(code, self.level, 'en', session_id))
+
+    def test_unchanged_statements_are_reused(self):
+        self.parse(self.code, 'session')
+        result = self.parse(self.code + "\nprint 'doei'", 'session')
+
+        self.assertEqual(self.parse(self.code + "\nprint 'doei'"), result)
+        # the if and its else are one statement
+        self.assertEqual(3, self.record.attributes['parse_reused_statements'])
+
+    def test_changed_statement_is_parsed_again(self):
+        self.parse(self.code, 'session')
+        changed = self.code.replace("print 'leuk'", "print 'heel leuk'")
+        result = self.parse(changed, 'session')
+
+        self.assertEqual(self.parse(changed), result)
+        self.assertEqual(1, self.record.attributes['parse_reused_statements'])
+
+    def test_same_program_is_the_same(self):
+        self.parse(self.code, 'session')
+        result = hedy.parse_input(self.code, self.level, 'en', 'session')
+
+        self.assertEqual(hedy.parse_input(self.code, self.level, 'en'), result)
+        self.assertEqual(result.meta.end_pos, hedy.parse_input(self.code, self.level, 'en').meta.end_pos)
+
+    def test_sessions_do_not_share_statements(self):
+        self.parse(self.code, 'session')
+        self.parse(self.code, 'other session')
+
+        self.assertNotIn('parse_reused_statements', self.record.attributes)
+
+    def test_error_in_changed_statement_is_the_same(self):
+        self.parse(self.code, 'session')
+        with self.assertRaises(exceptions.ParseException) as full:
+            hedy.parse_input(self.code + "\nif naam is", self.level, 'en')
+        with self.assertRaises(exceptions.ParseException) as incremental:
+            hedy.parse_input(self.code + "\nif naam is", self.level, 'en', 'session')
+
+        self.assertEqual(full.exception.arguments, incremental.exception.arguments)
+
+    def test_transpile_with_session_is_the_same(self):
+        hedy.transpile(self.code, self.level, session_id='session')
+        code = self.code + "\nprint 'doei'"
+
+        self.assertEqual(hedy.transpile(code, self.level).code,
+                         hedy.transpile(code, self.level, session_id='session').code)
@@ -0,0 +1,46 @@
+import unittest
+
+import hedy
+import hedy_content
+import hedy_translation
+import keyword_registry
+
+
+class TestKeywordRegistry(unittest.TestCase):
+    def test_default_spelling_is_first(self):
+        self.assertEqual('répète', keyword_registry.keyword_from_en('repeat', 'fr'))
+        self.assertEqual(('répète', 'repete'), keyword_registry.get_language('fr').spellings['repeat'])
+
+    def test_every_spelling_translates_to_en(self):
+        self.assertEqual('repeat', keyword_registry.keyword_to_en('répète', 'fr'))
+        self.assertEqual('repeat', keyword_registry.keyword_to_en('repete', 'fr'))
+        self.assertEqual('hallo', keyword_registry.keyword_to_en('hallo', 'fr'))
+
+    def test_unknown_keyword_is_not_translated(self):
+        self.assertEqual('hallo', keyword_registry.keyword_from_en('hallo', 'nl'))
+
+    def test_keywords_to_dict_returns_a_copy(self):
+        keywords = hedy_translation.keywords_to_dict('nl')
+        keywords['print'].append('druk')
+
+        self.assertEqual(['print'], hedy_translation.keywords_to_dict('nl')['print'])
+
+    def test_list_keywords_falls_back_to_en(self):
+        self.assertEqual(['vraag', 'print'], hedy.get_list_keywords(['ask', 'print'], 'nl'))
+        self.assertEqual(['ask', 'print'], hedy.get_list_keywords(['ask', 'print'], 'xx'))
+
+    def test_keywords_of_languages_without_keywords(self):
+        self.assertIsNone(hedy_content.KEYWORDS.get('xx'))
+        self.assertFalse(keyword_registry.has_language('xx'))
+        with self.assertRaises(KeyError):
+            keyword_registry.get_language('xx')
+
+    def test_keywords_per_language(self):
+        self.assertEqual('herhaal', hedy_content.KEYWORDS['nl']['repeat'])
+        self.assertEqual(set(hedy_content.ALL_KEYWORD_LANGUAGES), set(hedy_content.KEYWORDS))
+
+    def test_spellings_that_are_not_strings(self):
+        language = keyword_registry.KeywordLanguage('xx', {'print': 1, 'ask': True, 'echo': 'echo|ekko'})
+
+        self.assertEqual({'print': '1', 'ask': 'True', 'echo': 'echo'}, language.defaults)
+        self.assertEqual('print', language.to_en['1'])
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import hedy
+
+
+class TestParserCache(unittest.TestCase):
+    def setUp(self):
+        self.original_cache_dir = hedy.PARSER_CACHE_DIR
+        hedy.PARSER_CACHE_DIR = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(hedy.PARSER_CACHE_DIR, ignore_errors=True)
+        hedy.PARSER_CACHE_DIR = self.original_cache_dir
+
+    def test_parser_is_written_to_disk(self):
+        grammar = hedy.create_grammar(3, 'en')
+        hedy.create_parser(grammar)
+
+        self.assertTrue(os.path.isfile(hedy.parser_cache_filename(grammar, False)))
+
+    def test_cached_parser_parses_the_same(self):
+        grammar = hedy.create_grammar(12, 'en')
+        code = hedy.process_input_string("dieren = 'Hond', 'Kat'\nprint dieren at random", 12, 'en')
+
+        built = hedy.create_parser(grammar)
+        loaded = hedy.load_parser_from_disk(hedy.parser_cache_filename(grammar, False))
+
+        self.assertIsNotNone(loaded)
+        self.assertEqual(built.parse(code + '\n'), loaded.parse(code + '\n'))
+
+    def test_keep_all_tokens_is_part_of_the_key(self):
+        grammar = hedy.create_grammar(1, 'en')
+        self.assertNotEqual(hedy.parser_cache_filename(grammar, False), hedy.parser_cache_filename(grammar, True))
+
+    def test_cache_directory_is_private(self):
+        grammar = hedy.create_grammar(1, 'en')
+        shutil.rmtree(hedy.PARSER_CACHE_DIR)
+        hedy.create_parser(grammar)
+
+        self.assertEqual(0o700, os.stat(hedy.PARSER_CACHE_DIR).st_mode & 0o777)
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), 'files have no owners on Windows')
+    def test_file_of_another_user_is_not_loaded(self):
+        grammar = hedy.create_grammar(1, 'en')
+        hedy.create_parser(grammar)
+
+        with unittest.mock.patch('os.getuid', return_value=os.getuid() + 1):
+            self.assertIsNone(hedy.load_parser_from_disk(hedy.parser_cache_filename(grammar, False)))
+
+    def test_corrupt_cache_file_is_ignored(self):
+        grammar = hedy.create_grammar(1, 'en')
+        filename = hedy.parser_cache_filename(grammar, False)
+        with open(filename, 'wb') as f:
+            f.write(b'not a parser')
+
+        self.assertIsNone(hedy.load_parser_from_disk(filename))
+        self.assertIsNotNone(hedy.create_parser(grammar))
+
+
+class TestTotalGrammarFiles(unittest.TestCase):
+    # a language code that no real grammar uses, so we don't overwrite generated files
+    lang = 'test_lang'
+
+    def tearDown(self):
+        for level in [1, 2]:
+            filename = hedy.get_total_grammar_filename(level, self.lang)
+            if os.path.isfile(filename):
+                os.unlink(filename)
+
+    def test_saved_grammar_is_loaded(self):
+        grammar = hedy.merge_grammars_for_level(2, self.lang)
+        hedy.save_total_grammar_file(2, grammar, self.lang)
+
+        self.assertEqual(grammar, hedy.load_total_grammar_file(2, self.lang))
+        self.assertEqual(grammar, hedy.create_grammar(2, self.lang))
+
+    def test_grammar_merged_by_other_code_is_not_loaded(self):
+        grammar = hedy.merge_grammars_for_level(2, self.lang)
+        hedy.save_total_grammar_file(2, grammar, self.lang)
+
+        with unittest.mock.patch.object(hedy, 'grammar_merge_functions', lambda: [hedy.merge_grammars]), \
+                unittest.mock.patch.object(hedy, 'GRAMMAR_SOURCES_HASH', None):
+            self.assertIsNone(hedy.load_total_grammar_file(2, self.lang))
+
+    def test_outdated_grammar_is_not_loaded(self):
+        with open(hedy.get_total_grammar_filename(1, self.lang), 'w', encoding='utf-8') as f:
+            f.write(hedy.TOTAL_GRAMMAR_HEADER + 'outdated\n')
+            f.write('start: program')
+
+        self.assertIsNone(hedy.load_total_grammar_file(1, self.lang))
+        self.assertEqual(hedy.merge_grammars_for_level(1, self.lang), hedy.create_grammar(1, self.lang))
@@ -0,0 +1,45 @@
+import unittest
+
+import hedy
+from tests.Tester import HedyTester
+
+
+class TestPreprocessor(unittest.TestCase):
+    def test_if_with_command_gets_else(self):
+        code = HedyTester.dedent(
+            "if naam is Hedy print 'leuk'",
+            "print 'klaar'")
+
+        self.assertEqual(HedyTester.dedent(
+            "if naam is Hedy print 'leuk' else _ is x",
+            "print 'klaar'"), hedy.process_input_string(code, 5, 'en'))
+
+    def test_if_with_else_on_next_line_is_unchanged(self):
+        code = HedyTester.dedent(
+            "als naam is Hedy print 'leuk'",
+            "anders print 'minder leuk'")
+
+        self.assertEqual(code, hedy.process_input_string(code, 6, 'nl'))
+
+    def test_translated_if_gets_else(self):
+        code = HedyTester.dedent(
+            "als naam is Hedy print 'leuk'",
+            "print 'klaar'")
+
+        self.assertEqual(HedyTester.dedent(
+            "als naam is Hedy print 'leuk' else _ is x",
+            "print 'klaar'"), hedy.process_input_string(code, 5, 'nl'))
+
+    def test_blocks_are_ended(self):
+        code = "herhaal 3 keer\n    voor i in bereik 1 tot 3\n        print i\nprint 'klaar'"
+
+        expected = "herhaal 3 keer\n    voor i in bereik 1 tot 3\n        print i#ENDBLOCK#ENDBLOCK\nprint 'klaar'"
+
+        self.assertEqual(expected, hedy.process_input_string(code, 10, 'nl'))
+
+    def test_line_requires_indentation(self):
+        self.assertTrue(hedy.line_requires_indentation("    for i in range 1 to 3", 'en'))
+        self.assertTrue(hedy.line_requires_indentation("repeat 3 times:", 'en'))
+        self.assertTrue(hedy.line_requires_indentation("anders", 'nl'))
+        self.assertFalse(hedy.line_requires_indentation("forward 100", 'en'))
+        self.assertTrue(hedy.line_requires_indentation("if x is 3", 'el'))
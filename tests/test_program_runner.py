@@ -0,0 +1,46 @@
+import signal
+import unittest
+
+import hedy
+import program_runner
+
+
+class TestProgramRunner(unittest.TestCase):
+    def setUp(self):
+        program_runner.CODE_CACHE.clear()
+
+    def test_output_is_captured(self):
+        result = hedy.transpile("print 'hallo'", 4)
+        output, errors = program_runner.run_program(result.code, program_runner.prefixes_for(result))
+
+        self.assertEqual('hallo\n', output)
+        self.assertEqual('', errors)
+
+    def test_code_is_compiled_once(self):
+        hits = program_runner.CODE_CACHE.hits
+        program_runner.run_program("print('hallo')")
+        program_runner.run_program("print('hallo')")
+
+        self.assertEqual(1, len(program_runner.CODE_CACHE))
+        self.assertEqual(hits + 1, program_runner.CODE_CACHE.hits)
+
+    def test_every_run_has_a_fresh_namespace(self):
+        program_runner.run_program("x = 1", namespace={'y': 2})
+
+        with self.assertRaises(NameError):
+            program_runner.run_program("print(x)")
+        self.assertEqual(('2\n', ''), program_runner.run_program("print(y)", namespace={'y': 2}))
+
+    def test_long_running_program_is_stopped(self):
+        with self.assertRaises(program_runner.ProgramTimeoutError):
+            program_runner.run_program("while True:\n  pass", time_limit=0.2)
+
+    def test_timer_is_stopped_after_timeout(self):
+        handler = signal.getsignal(signal.SIGALRM)
+        with self.assertRaises(program_runner.ProgramTimeoutError):
+            # swallows the first timeouts, like a program with a try/except around its loop could
+            program_runner.run_program("for i in range(3):\n  try:\n    while True:\n      pass\n  except Exception:\n"
+                                       "    pass\nwhile True:\n  pass", time_limit=0.2)
+
+        self.assertEqual(handler, signal.getsignal(signal.SIGALRM))
+        self.assertEqual((0.0, 0.0), signal.getitimer(signal.ITIMER_REAL))
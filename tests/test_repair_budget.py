@@ -0,0 +1,69 @@
+import unittest
+
+import exceptions
+import hedy
+from website import querylog
+
+
+class TestRepairBudget(unittest.TestCase):
+    # removing the spaces gives a program with a misspelled command, which needs another repair
+    code = "  prnt hallo"
+
+    def setUp(self):
+        self.original_max_transpiles = hedy.REPAIR_MAX_TRANSPILES
+        hedy.TRANSPILE_CACHE.clear()
+        hedy.REPAIR_CACHE.clear()
+        self.record = querylog.LogRecord()
+        querylog.THREAD_LOCAL.current_log_record = self.record
+
+    def tearDown(self):
+        hedy.REPAIR_MAX_TRANSPILES = self.original_max_transpiles
+        querylog.THREAD_LOCAL.current_log_record = querylog.NullRecord()
+
+    def test_repairs_of_repairs(self):
+        with self.assertRaises(exceptions.InvalidCommandException) as context:
+            hedy.transpile(self.code, 1)
+
+        self.assertEqual('print hallo', context.exception.fixed_code)
+        self.assertIsNotNone(context.exception.fixed_result)
+        self.assertEqual(2, self.record.attributes['repair_transpiles'])
+
+    def test_repairs_stop_when_budget_is_used_up(self):
+        hedy.REPAIR_MAX_TRANSPILES = 1
+        with self.assertRaises(exceptions.InvalidCommandException) as context:
+            hedy.transpile(self.code, 1)
+
+        self.assertIsNone(context.exception.fixed_result)
+        self.assertEqual(1, self.record.attributes['repair_transpiles'])
+        self.assertEqual(1, self.record.attributes['repair_budget_exhausted'])
+
+    def test_program_is_repaired_again_when_there_is_budget(self):
+        hedy.REPAIR_MAX_TRANSPILES = 1
+        with self.assertRaises(exceptions.InvalidCommandException) as context:
+            hedy.transpile(self.code, 1)
+        self.assertIsNone(context.exception.fixed_result)
+
+        hedy.REPAIR_MAX_TRANSPILES = self.original_max_transpiles
+        with self.assertRaises(exceptions.InvalidCommandException) as context:
+            hedy.transpile(self.code, 1)
+
+        self.assertEqual('print hallo', context.exception.fixed_code)
+        self.assertEqual("print('hallo')", context.exception.fixed_result.code)
+
+    def test_program_with_leading_spaces_runs_when_budget_is_used_up(self):
+        hedy.REPAIR_MAX_TRANSPILES = 0
+        with self.assertRaises(exceptions.InvalidSpaceException) as context:
+            hedy.transpile("  print hallo", 1)
+
+        self.assertEqual("print('hallo')", context.exception.fixed_result.code)
+        self.assertEqual(1, self.record.attributes['repair_budget_exhausted'])
+
+    def test_repair_outcomes_are_remembered(self):
+        with self.assertRaises(exceptions.InvalidCommandException):
+            hedy.transpile("prnt hallo", 1)
+        with self.assertRaises(exceptions.InvalidCommandException) as context:
+            hedy.transpile("prinnt hallo", 1)
+
+        self.assertEqual('print hallo', context.exception.fixed_code)
+        self.assertIsNotNone(context.exception.fixed_result)
+        self.assertEqual(1, self.record.attributes['repair_transpiles'])
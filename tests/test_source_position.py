@@ -0,0 +1,48 @@
+import unittest
+
+import hedy
+from tests.Tester import HedyTester
+
+
+class TestSourcePosition(unittest.TestCase):
+    level = 5
+    code = HedyTester.dedent(
+        "naam is ask 'hoe heet jij?'",
+        "if naam is Hedy print 'leuk' else print 'minder leuk'")
+
+    def parse(self, code):
+        return hedy.parse_input(hedy.process_input_string(code, self.level, 'en'), self.level, 'en')
+
+    def test_parse_tree_has_source_positions(self):
+        program = self.parse(self.code)
+
+        for tree in program.iter_subtrees():
+            self.assertIsInstance(tree.meta, hedy.SourcePosition)
+        ask = program.children[0]
+        self.assertEqual((1, 1, 0), (ask.meta.line, ask.meta.column, ask.meta.start_pos))
+        self.assertEqual((2, 1), (program.children[1].meta.line, program.children[1].meta.column))
+
+    def test_positions_are_copied_from_lark(self):
+        meta = hedy.get_parser(self.level, 'en').parse(self.code + '\n').children[0].meta
+        position = hedy.SourcePosition(meta)
+
+        for field in hedy.SourcePosition.__slots__:
+            self.assertEqual(getattr(meta, field), getattr(position, field))
+
+    def test_shifted_position(self):
+        program = self.parse(self.code)
+        position = program.children[1].meta.shifted(3, 10)
+
+        self.assertEqual(program.children[1].meta.line + 3, position.line)
+        self.assertEqual(program.children[1].meta.column, position.column)
+        self.assertEqual(program.children[1].meta.end_pos + 10, position.end_pos)
+        self.assertIsNot(program.children[1].meta, position)
+
+    def test_error_line_numbers(self):
+        code = HedyTester.dedent(
+            "print 'hallo'",
+            "print naam")
+
+        with self.assertRaises(hedy.exceptions.UnquotedTextException) as context:
+            hedy.transpile(code, 5)
+        self.assertEqual(2, context.exception.arguments['line_number'])
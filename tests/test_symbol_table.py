@@ -0,0 +1,38 @@
+import unittest
+
+import hedy
+from tests.Tester import HedyTester
+
+
+class TestSymbolTable(unittest.TestCase):
+    def analyze(self, code, level):
+        program_root = hedy.parse_input(hedy.process_input_string(code, level, 'en'), level, 'en')
+        abstract_syntax_tree = hedy.ExtractAST().transform(program_root)
+        return hedy.SemanticAnalyzer(level).analyze(abstract_syntax_tree).lookup
+
+    def test_entries_are_indexed_by_name(self):
+        lookup = self.analyze(HedyTester.dedent(
+            "dier is hond",
+            "kleur is rood",
+            "dier is kat"), 2)
+
+        self.assertEqual(['dier', 'kleur', 'dier'], [entry.name for entry in lookup])
+        self.assertEqual([1, 3], [entry.linenumber for entry in lookup.get('dier')])
+        self.assertEqual([], lookup.get('vis'))
+
+    def test_definitions_before_line(self):
+        lookup = self.analyze(HedyTester.dedent(
+            "print 'hallo'",
+            "dier = 'hond'",
+            "dier = 'kat'"), 12)
+
+        self.assertEqual(0, lookup.count_definitions_before('dier', 1))
+        self.assertEqual(1, lookup.count_definitions_before('dier', 2))
+        self.assertEqual(2, lookup.count_definitions_before('dier', 100))
+        self.assertEqual(0, lookup.count_definitions_before('vis', 100))
+
+    def test_names_are_stored_hashed(self):
+        lookup = self.analyze("sum = 5", 12)
+
+        self.assertTrue(lookup.is_defined('_sum'))
+        self.assertFalse(lookup.is_defined('sum'))
@@ -0,0 +1,85 @@
+import textwrap
+import unittest
+
+from parameterized import parameterized
+
+import hedy
+import hedy_translation
+
+
+class TestTranslationFastPath(unittest.TestCase):
+    def parsed_rules(self, code, lang, level):
+        program_root = hedy.get_parser(level, lang, True).parse(code + "\n").children[0]
+        translator = hedy_translation.Translator(code)
+        translator.visit(program_root)
+        # the tokens of the parser include the spaces around keywords, and the tokenizer skips commas when both
+        # languages use the same comma
+        return sorted((rule.keyword, rule.line, rule.start + len(rule.value) - len(rule.value.lstrip()),
+                       rule.value.strip()) for rule in translator.rules if rule.keyword != 'comma')
+
+    def tokenized_rules(self, code, lang, level, to_lang='nl'):
+        processed_code = hedy.process_input_string(code, level, lang, escape_backslashes=False)
+        rules = hedy_translation.find_keyword_rules(processed_code, lang, to_lang, level)
+        return None if rules is None else sorted((rule.keyword, rule.line, rule.start, rule.value) for rule in rules)
+
+    @parameterized.expand([
+        ("naam is ask 'hoe heet jij?'\nprint 'hallo ' naam", 4),
+        ("dieren = 'hond', 'kat'\nadd 'kangoeroe' to dieren\nprint dieren at random", 12),
+        ("repeat 3 times forward 10\nturn 90\ncolor red", 7),
+        ("lijst is 1, 2, 3\nfor i in range 1 to 10\n    print i\nremove 3 from lijst", 11),
+        ("naam = 'Hedy'\nleeftijd = 2\nif naam is 'Hedy' and leeftijd is 2\n    print 'hallo'\nelse\n    sleep", 13),
+        ("leeftijd = input('hoe oud?')\nwhile leeftijd < 10:\n    print('jong')\nfor i in range(1, 3):\n    sleep", 18),
+    ])
+    def test_tokenizer_finds_the_keywords_of_the_parser(self, code, level):
+        processed_code = hedy.process_input_string(code, level, 'en', escape_backslashes=False)
+
+        self.assertEqual(self.parsed_rules(processed_code, 'en', level), self.tokenized_rules(code, 'en', level))
+
+    def test_tokenizer_finds_keywords_in_both_languages(self):
+        code = "naam is vraag 'hoe heet jij?'\nprint naam"
+
+        self.assertEqual(self.parsed_rules(code, 'nl', 4), self.tokenized_rules(code, 'nl', 4, to_lang='en'))
+
+    @parameterized.expand([
+        ("print hallo", 2),  # unquoted text
+        ("left = -90\nturn left", 12),  # keyword as variable
+        ("dier is in de tuin", 4),  # keyword in text
+        ("if naam is Hedy Lamarr print 'hallo'", 5),  # condition with spaces
+        ("if x is pressed print 'x' else print 'y'", 5),  # not translated by the Translator
+        ("Now we can use repeat", 7),  # not a program
+        ("print 'it's'", 4),  # quotes that don't match
+        ("dieren is hond, kat", 4),  # unquoted list items
+        ("print Hedy is fun!", 4),  # keyword in unquoted text
+        ("print This will be printed 5 times", 7),  # keyword in unquoted text
+        ("print 'hallo ' naam", 4),  # variable that is never defined
+    ])
+    def test_tokenizer_leaves_doubts_to_the_parser(self, code, level):
+        self.assertIsNone(self.tokenized_rules(code, 'en', level))
+
+    def test_to_is_told_apart_by_the_keyword_before_it(self):
+        code = textwrap.dedent("""\
+        lijst is 1, 2
+        for i in range 1 to 10
+            add i to lijst""")
+
+        result = hedy_translation.translate_keywords(code, from_lang="en", to_lang="nl", level=11)
+
+        self.assertEqual(textwrap.dedent("""\
+        lijst is 1, 2
+        voor i in bereik 1 tot 10
+            voeg i toe aan lijst"""), result)
+
+    @parameterized.expand([
+        ("print Hedy is fun!", "fr", 4),
+        ("print This will be printed 5 times", "nl", 7),
+    ])
+    def test_keywords_in_unquoted_text_are_not_translated(self, code, to_lang, level):
+        result = hedy_translation.translate_keywords(code, from_lang="en", to_lang=to_lang, level=level)
+
+        self.assertEqual(code, result)
+
+    def test_turn_left_is_translated(self):
+        # Earley parses `left` as a text or as the left keyword, depending on the hash seed
+        result = hedy_translation.translate_keywords("turn left\nforward 10", from_lang="en", to_lang="nl", level=7)
+
+        self.assertEqual("draai links\nvooruit 10", result)
@@ -72,3 +72,17 @@ class TestsTranslationLevel13(HedyTester):
             print 'hallo'""")
 
         self.assertEqual(expected, result)
+
+    def test_multiple_or_conditions_english_dutch(self):
+        code = textwrap.dedent("""\
+        naam = 'hedy'
+        if naam is 'hedy' or naam is 'Hedy' or naam is 'HEDY'
+            print 'hallo'""")
+
+        result = hedy_translation.translate_keywords(code, from_lang="en", to_lang="nl", level=self.level)
+        expected = textwrap.dedent("""\
+        naam = 'hedy'
+        als naam is 'hedy' of naam is 'Hedy' of naam is 'HEDY'
+            print 'hallo'""")
+
+        self.assertEqual(expected, result)
@@ -0,0 +1,95 @@
+import unittest
+
+import exceptions
+import hedy
+from bounded_cache import BoundedCache
+from website import querylog
+
+
+class TestBoundedCache(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = BoundedCache(max_bytes=10)
+        cache.put('a', 1, 4)
+        cache.put('b', 2, 4)
+        cache.get('a')
+        cache.put('c', 3, 4)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(8, cache.current_bytes)
+
+    def test_value_larger_than_budget_is_not_stored(self):
+        cache = BoundedCache(max_bytes=10)
+        cache.put('a', 1, 11)
+        self.assertEqual(0, len(cache))
+
+    def test_hits_and_misses_are_counted(self):
+        cache = BoundedCache(max_bytes=10)
+        cache.put('a', 1, 1)
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+
+class TestTranspileCache(unittest.TestCase):
+    def setUp(self):
+        hedy.TRANSPILE_CACHE.clear()
+
+    def test_result_is_cached(self):
+        first = hedy.transpile("print 'hallo'", 4)
+        second = hedy.transpile("print 'hallo'", 4)
+
+        self.assertIs(first, second)
+        self.assertEqual(1, len(hedy.TRANSPILE_CACHE))
+
+    def test_cached_result_cannot_be_changed(self):
+        result = hedy.transpile("print 'hallo'", 4)
+
+        with self.assertRaises(AttributeError):
+            result.commands.append('ask')
+        with self.assertRaises(AttributeError):
+            result.print_arguments.append('hallo')
+
+    def test_level_is_part_of_the_key(self):
+        hedy.transpile("print 'hallo'", 4)
+        hedy.transpile("print 'hallo'", 5)
+        self.assertEqual(2, len(hedy.TRANSPILE_CACHE))
+
+    def test_exception_is_cached_and_raised_again(self):
+        code = "prnt 'hallo'"
+        with self.assertRaises(exceptions.InvalidCommandException) as first:
+            hedy.transpile(code, 4)
+        # callers may change the arguments, that should not affect the cache
+        first.exception.arguments['invalid_command'] = 'changed'
+
+        with self.assertRaises(exceptions.InvalidCommandException) as second:
+            hedy.transpile(code, 4)
+
+        self.assertEqual('prnt', second.exception.arguments['invalid_command'])
+        self.assertEqual(first.exception.fixed_code, second.exception.fixed_code)
+
+    def test_exception_without_all_repairs_is_not_cached(self):
+        original_max_transpiles = hedy.REPAIR_MAX_TRANSPILES
+        hedy.REPAIR_MAX_TRANSPILES = 0
+        hedy.REPAIR_CACHE.clear()
+        try:
+            with self.assertRaises(exceptions.InvalidCommandException) as context:
+                hedy.transpile("prnt 'hallo'", 4)
+        finally:
+            hedy.REPAIR_MAX_TRANSPILES = original_max_transpiles
+
+        self.assertIsNone(context.exception.fixed_result)
+        self.assertEqual(0, len(hedy.TRANSPILE_CACHE))
+
+    def test_hits_and_misses_are_logged(self):
+        record = querylog.LogRecord()
+        querylog.THREAD_LOCAL.current_log_record = record
+        try:
+            hedy.transpile("print 'hallo'", 4)
+            hedy.transpile("print 'hallo'", 4)
+        finally:
+            querylog.THREAD_LOCAL.current_log_record = querylog.NullRecord()
+
+        self.assertEqual(1, record.attributes['transpile_cache_miss'])
+        self.assertEqual(1, record.attributes['transpile_cache_hit'])
@@ -0,0 +1,49 @@
+import pickle
+import unittest
+
+import exceptions
+import hedy
+
+
+class TestTranspileMany(unittest.TestCase):
+    items = [
+        ("print hallo", 1),
+        ("print 'hallo'", 4, 'en'),
+        ("prinnt hallo", 1),
+        ("naam is Hedy\nprint naam", 2),
+        ("{print} hallo", 1, 'nl'),
+    ]
+
+    def expected(self, item):
+        try:
+            return hedy.transpile(*item).code, None
+        except exceptions.HedyException as ex:
+            return None, type(ex)
+
+    def outcomes(self, results):
+        return [(None if result is None else result.code, None if ex is None else type(ex)) for result, ex in results]
+
+    def test_results_are_in_order(self):
+        results = hedy.transpile_many(iter(self.items), workers=2)
+
+        self.assertEqual([self.expected(item) for item in self.items], self.outcomes(results))
+
+    def test_exceptions_are_captured(self):
+        (result, ex), = hedy.transpile_many([("prinnt hallo", 1)], workers=2)
+
+        self.assertIsNone(result)
+        self.assertIsInstance(ex, exceptions.InvalidCommandException)
+        self.assertEqual('prinnt', ex.arguments['invalid_command'])
+
+    def test_single_worker_transpiles_in_process(self):
+        results = hedy.transpile_many(self.items, workers=1)
+
+        self.assertEqual([self.expected(item) for item in self.items], self.outcomes(results))
+
+    def test_hedy_exceptions_can_be_pickled(self):
+        ex = exceptions.ParseException(level=3, location=(1, 2), found='space')
+        copy = pickle.loads(pickle.dumps(ex))
+
+        self.assertIsInstance(copy, exceptions.ParseException)
+        self.assertEqual(ex.args, copy.args)
+        self.assertEqual(ex.arguments, copy.arguments)
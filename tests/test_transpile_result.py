@@ -0,0 +1,36 @@
+import unittest
+
+import hedy
+from tests.Tester import HedyTester
+
+
+class TestTranspileResult(unittest.TestCase):
+    code = HedyTester.dedent(
+        "naam is ask 'hoe heet jij?'",
+        "print 'hallo ' naam",
+        "print 'hallo ' naam",
+        "sleep 1")
+    level = 4
+
+    def test_commands_are_the_same_as_all_commands(self):
+        result = hedy.transpile(self.code, self.level)
+
+        self.assertEqual(hedy.all_commands(self.code, self.level), list(result.commands))
+        self.assertEqual(('ask', 'print', 'print', 'sleep'), result.commands)
+
+    def test_command_counts(self):
+        result = hedy.transpile(self.code, self.level)
+
+        self.assertEqual({'ask': 1, 'print': 2, 'sleep': 1}, result.command_counts)
+
+    def test_print_arguments_are_the_same_as_all_print_arguments(self):
+        result = hedy.transpile(self.code, self.level)
+
+        self.assertEqual(hedy.all_print_arguments(self.code, self.level), list(result.print_arguments))
+
+    def test_key_of_ifpressed_is_the_same_as_in_all_commands(self):
+        code = "repeat 3 times if x is pressed forward 15"
+        result = hedy.transpile(code, 7)
+
+        self.assertEqual(hedy.all_commands(code, 7), list(result.commands))
+        self.assertEqual(hedy.all_print_arguments(code, 7), list(result.print_arguments))
@@ -0,0 +1,35 @@
+import unittest
+
+import exceptions
+import hedy
+from tests.Tester import HedyTester
+from website import querylog
+
+
+class TestTranspileStages(unittest.TestCase):
+    def setUp(self):
+        self.record = querylog.LogRecord()
+        querylog.THREAD_LOCAL.current_log_record = self.record
+
+    def tearDown(self):
+        querylog.THREAD_LOCAL.current_log_record = querylog.NullRecord()
+
+    def test_every_stage_is_timed(self):
+        code = HedyTester.dedent(
+            "naam is ask 'hoe heet jij?'",
+            "if naam is Hedy print 'leuk' else print 'minder leuk'")
+        hedy.transpile_inner(code, 5)
+
+        for stage in hedy.TRANSPILE_STAGES:
+            self.assertIn(f'{stage}_us', self.record.attributes)
+        self.assertEqual(2, self.record.attributes['transpile_lines'])
+        self.assertEqual(1, self.record.attributes['transpile_lookup_entries'])
+        self.assertGreater(self.record.attributes['transpile_nodes'], 0)
+
+    def test_repairs_are_not_timed_as_stages(self):
+        with self.assertRaises(exceptions.HedyException):
+            hedy.transpile_inner("  prnt hallo", 1)
+
+        self.assertGreater(self.record.attributes['repair_transpiles'], 0)
+        self.assertIn('transpile_parse_us', self.record.attributes)
+        self.assertNotIn('transpile_nodes', self.record.attributes)
@@ -0,0 +1,61 @@
+import signal
+import unittest
+
+import exceptions
+import hedy
+from website import querylog
+
+
+class TestTranspileTimeBudget(unittest.TestCase):
+    # takes the parser well over the time budget used in these tests
+    code = '\n'.join(["print 'hallo' 1 + 2 + 3 + 4 + 5 + 6 + 7 + 8 + 9"] * 100)
+
+    def setUp(self):
+        self.original_budget = hedy.TRANSPILE_TIME_BUDGET
+        hedy.TRANSPILE_TIME_BUDGET = 0.01
+        hedy.TRANSPILE_CACHE.clear()
+        self.record = querylog.LogRecord()
+        querylog.THREAD_LOCAL.current_log_record = self.record
+
+    def tearDown(self):
+        hedy.TRANSPILE_TIME_BUDGET = self.original_budget
+        querylog.THREAD_LOCAL.current_log_record = querylog.NullRecord()
+
+    def test_slow_program_raises_timeout(self):
+        with self.assertRaises(exceptions.TranspileTimeoutException):
+            hedy.transpile_with_time_budget(self.code, 6)
+
+        self.assertEqual(10, self.record.attributes['transpile_time_budget_ms'])
+        self.assertEqual(1, self.record.attributes['transpile_timeout'])
+
+    def test_timeout_is_not_cached(self):
+        with self.assertRaises(exceptions.TranspileTimeoutException):
+            hedy.transpile_with_time_budget(self.code, 6)
+
+        self.assertEqual(0, len(hedy.TRANSPILE_CACHE))
+
+    def test_caches_are_consistent_after_timeout(self):
+        with self.assertRaises(exceptions.TranspileTimeoutException):
+            hedy.transpile_with_time_budget(self.code, 6, session_id='time-budget-test')
+
+        for cache in [hedy.TRANSPILE_CACHE, hedy.PARSE_STATE_CACHE, hedy.REPAIR_CACHE]:
+            self.assertEqual(sum(size for _, size in cache._entries.values()), cache.current_bytes)
+
+    def test_budget_of_zero_disables_timeout(self):
+        hedy.TRANSPILE_TIME_BUDGET = 0
+        hedy.transpile_with_time_budget(self.code, 6)
+
+        self.assertNotIn('transpile_timeout', self.record.attributes)
+
+    def test_transpile_has_no_time_budget(self):
+        hedy.transpile(self.code, 6)
+
+        self.assertNotIn('transpile_timeout', self.record.attributes)
+
+    def test_handler_is_restored_after_timeout(self):
+        handler = signal.getsignal(signal.SIGPROF)
+        with self.assertRaises(exceptions.TranspileTimeoutException):
+            hedy.transpile_with_time_budget(self.code, 6)
+
+        self.assertEqual(handler, signal.getsignal(signal.SIGPROF))
+        self.assertEqual((0.0, 0.0), signal.getitimer(signal.ITIMER_PROF))
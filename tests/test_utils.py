@@ -1,3 +1,4 @@
+import time
 import unittest
 
 import bcrypt
@@ -24,3 +25,14 @@ class TestUtils(unittest.TestCase):
     def test_extract_default_rounds(self):
         salt = bcrypt.gensalt().decode('utf-8')
         self.assertEqual(12, utils.extract_bcrypt_rounds(salt))
+
+    def test_time_limit_does_not_interrupt_without_time_limit_block(self):
+        finished = []
+        with self.assertRaises(TimeoutError):
+            with utils.time_limit(0.01, TimeoutError):
+                with utils.without_time_limit():
+                    time.sleep(0.05)
+                    finished.append(True)
+                while True:
+                    pass
+        self.assertEqual([True], finished)
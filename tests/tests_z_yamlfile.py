@@ -1,7 +1,10 @@
 import os
+import tempfile
 import time
 import unittest
 
+import utils
+from website import yaml_file
 from website.yaml_file import YamlFile
 
 
@@ -41,3 +44,56 @@ class TestYamlFile(unittest.TestCase):
         print(
             f'YAML loading takes {original_seconds / n} seconds, unpickling takes {cached_seconds / n}'
             f'({original_seconds / cached_seconds:.1f}x faster)')
+
+
+class TestYamlDataCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'data.yaml')
+        self.write('key: first', time.time() - 100)
+        self.file = YamlFile(self.filename)
+        self.original_interval = yaml_file.YAML_CHECK_INTERVAL
+        yaml_file.YAML_DATA_CACHE.clear()
+
+    def tearDown(self):
+        yaml_file.YAML_CHECK_INTERVAL = self.original_interval
+        utils.set_debug_mode(False)
+        if os.path.isfile(self.file.pickle_filename):
+            os.unlink(self.file.pickle_filename)
+        self.directory.cleanup()
+
+    def write(self, contents, mtime):
+        with open(self.filename, 'w') as f:
+            f.write(contents)
+        os.utime(self.filename, (mtime, mtime))
+
+    def test_data_is_cached_for_the_process(self):
+        self.assertIs(self.file.access(), self.file.access())
+        self.assertIn(self.file.filename, yaml_file.YAML_DATA_CACHE)
+
+    def test_removed_file_has_no_data(self):
+        # writes the pickle file
+        self.file.load()
+        os.unlink(self.filename)
+
+        self.assertEqual({}, self.file.load())
+
+    def test_changed_file_is_reloaded_after_the_check_interval(self):
+        yaml_file.YAML_CHECK_INTERVAL = 3600
+        self.assertEqual('first', self.file['key'])
+        # newer than the pickle file of the first version
+        self.write('key: second', time.time() + 100)
+        self.assertEqual('first', self.file['key'])
+
+        yaml_file.YAML_CHECK_INTERVAL = 0
+        self.assertEqual('second', self.file['key'])
+
+    def test_new_generation_is_reloaded(self):
+        data = self.file.access()
+        yaml_file.invalidate_yaml_cache()
+        self.assertIsNot(data, self.file.access())
+
+    def test_debug_mode_only_caches_per_request(self):
+        utils.set_debug_mode(True)
+        self.assertIsNot(self.file.access(), self.file.access())
+        self.assertNotIn(self.file.filename, yaml_file.YAML_DATA_CACHE)
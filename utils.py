@@ -10,6 +10,8 @@ import os
 import re
 import string
 import random
+import signal
+import threading
 import uuid
 import unicodedata
 
@@ -278,6 +280,65 @@ def atomic_write_file(filename, mode='wb'):
     os.replace(tmp_file, filename)
 
 
+# How deep the current thread is in without_time_limit blocks
+TIME_LIMIT_STATE = threading.local()
+
+
+@contextlib.contextmanager
+def time_limit(seconds, make_exception, cpu_time=False):
+    """Raise the exception make_exception() returns in the code in this block if it runs longer than the given seconds.
+
+    The time is wall-clock time, or with cpu_time the CPU time of this process, which doesn't grow when other
+    processes keep us waiting. This uses a signal, so the limit is only enforced in the main thread (which is
+    where gunicorn workers handle their requests) and not on Windows.
+    """
+    if seconds <= 0 or not hasattr(signal, 'setitimer') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    timer, signum = (signal.ITIMER_PROF, signal.SIGPROF) if cpu_time else (signal.ITIMER_REAL, signal.SIGALRM)
+
+    raised = []
+
+    def on_timeout(signum, frame):
+        if getattr(TIME_LIMIT_STATE, 'deferrals', 0) > 0:
+            # the timer fires again soon, by then the code that can't be interrupted is done
+            return
+        raised.append(make_exception())
+        raise raised[-1]
+
+    previous_handler = signal.signal(signum, on_timeout)
+    # After the time runs out the timer keeps firing, in case the first exception is swallowed
+    # by an except clause in the code in the block
+    signal.setitimer(timer, seconds, 0.1)
+    try:
+        yield
+    finally:
+        # The timer can fire while we are stopping it, we just try again: the block is over by now
+        while True:
+            try:
+                signal.setitimer(timer, 0)
+                signal.signal(signum, previous_handler)
+                break
+            except BaseException as ex:
+                if not any(ex is timeout for timeout in raised):
+                    raise
+
+
+@contextlib.contextmanager
+def without_time_limit():
+    """Keep an enclosing time_limit from interrupting the code in this block.
+
+    Use this for code that must not be left halfway, like updating a cache. When the time runs out in the
+    block, the exception is raised shortly after it.
+    """
+    TIME_LIMIT_STATE.deferrals = getattr(TIME_LIMIT_STATE, 'deferrals', 0) + 1
+    try:
+        yield
+    finally:
+        TIME_LIMIT_STATE.deferrals -= 1
+
+
 # This function takes a date in milliseconds from the Unix epoch and transforms it into a printable date
 # It operates by converting the date to a string, removing its last 3 digits, converting it back to an int
 # and then invoking the `isoformat` date function on it
@@ -18,8 +18,32 @@ class Achievements:
         self.db = db
         self.translations = translations
         self.all_commands = self.get_all_commands()
-        self.total_users = 0
-        self.statistics = self.get_global_statistics()
+        # Loading the statistics scans the achievements of all users, so we only do that when we need them
+        self._statistics = None
+        self._total_users = 0
+
+    def load_statistics_if_necessary(self):
+        if self._statistics is None:
+            self._statistics = self.get_global_statistics()
+
+    @property
+    def statistics(self):
+        self.load_statistics_if_necessary()
+        return self._statistics
+
+    @property
+    def total_users(self):
+        self.load_statistics_if_necessary()
+        return self._total_users
+
+    def count_new_user(self):
+        # statistics we load later on already count this user
+        if self._statistics is not None:
+            self._total_users += 1
+
+    def count_achievement(self, achievement):
+        if self._statistics is not None:
+            self._statistics[achievement] += 1
 
     def get_all_commands(self):
         commands = []
@@ -38,7 +62,7 @@ class Achievements:
         for achievement in self.translations.get_translations("en").get("achievements").keys():
             statistics[achievement] = 0
 
-        self.total_users = len(all_achievements)
+        self._total_users = len(all_achievements)
         for user in all_achievements:
             for achieved in user.get("achieved", []):
                 statistics[achieved] += 1
@@ -95,13 +119,13 @@ class Achievements:
         else:
             return None
 
-    def verify_run_achievements(self, username, code=None, level=None, response=None):
+    def verify_run_achievements(self, username, code=None, level=None, response=None, transpile_result=None):
         self.initialize_user_data_if_necessary()
         if session["run_programs"] < self.ACHIEVEMENTS_THRESHOLD:
             return
         self.check_programs_run()
         if code and level:
-            self.check_code_achievements(code, level)
+            self.check_code_achievements(code, level, transpile_result)
         if code and response:
             self.check_response_achievements(code, response)
 
@@ -114,9 +138,9 @@ class Achievements:
 
         if len(session["new_achieved"]) > 0:
             if self.db.add_achievements_to_username(username, session["new_achieved"]):
-                self.total_users += 1
+                self.count_new_user()
             for achievement in session["new_achieved"]:
-                self.statistics[achievement] += 1
+                self.count_achievement(achievement)
                 session["achieved"].append(achievement)
             return True
         return False
@@ -128,9 +152,9 @@ class Achievements:
             session["new_achieved"].append("adventure_is_worthwhile")
         if len(session["new_achieved"]) > 0:
             if self.db.add_achievements_to_username(username, session["new_achieved"]):
-                self.total_users += 1
+                self.count_new_user()
             for achievement in session["new_achieved"]:
-                self.statistics[achievement] += 1
+                self.count_achievement(achievement)
                 session["achieved"].append(achievement)
             return True
         return False
@@ -141,9 +165,9 @@ class Achievements:
 
         if len(session["new_achieved"]) > 0:
             if self.db.add_achievements_to_username(username, session["new_achieved"]):
-                self.total_users += 1
+                self.count_new_user()
             for achievement in session["new_achieved"]:
-                self.statistics[achievement] += 1
+                self.count_achievement(achievement)
                 session["achieved"].append(achievement)
             return True
         return False
@@ -152,9 +176,9 @@ class Achievements:
         self.initialize_user_data_if_necessary()
         session["new_achieved"] = [achievement]
         if self.db.add_achievement_to_username(username, achievement):
-            self.total_users += 1
+            self.count_new_user()
         session["achieved"].append(achievement)
-        self.statistics[achievement] += 1
+        self.count_achievement(achievement)
         return self.get_earned_achievements()
 
     def get_earned_achievements(self):
@@ -205,26 +229,30 @@ class Achievements:
         if "deadline_daredevil_III" not in session["achieved"] and session["submitted_programs"] >= 10:
             session["new_achieved"].append("deadline_daredevil_III")
 
-    def check_code_achievements(self, code, level):
+    def check_code_achievements(self, code, level, transpile_result=None):
         self.initialize_user_data_if_necessary()
-        commands_in_code = hedy.all_commands(code, level, session["lang"])
+        # The result of transpiling the code already knows its commands, only parse the code again without one
+        if transpile_result is not None:
+            commands_in_code = transpile_result.commands
+        else:
+            commands_in_code = hedy.all_commands(code, level, session["lang"])
         if "trying_is_key" not in session["achieved"]:
             for command in list(set(commands_in_code)):  # To remove duplicates
                 if command not in session["commands"] and command in self.all_commands:
                     session["new_commands"].append(command)
             if set(session["commands"]).union(set(session["new_commands"])) == self.all_commands:
                 session["new_achieved"].append("trying_is_key")
-        if "did_you_say_please" not in session["achieved"] and "ask" in hedy.all_commands(code, level, session["lang"]):
+        if "did_you_say_please" not in session["achieved"] and "ask" in commands_in_code:
             session["new_achieved"].append("did_you_say_please")
-        if (
-            "talk-talk-talk" not in session["achieved"]
-            and hedy.all_commands(code, level, session["lang"]).count("ask") >= 5
-        ):
+        if "talk-talk-talk" not in session["achieved"] and commands_in_code.count("ask") >= 5:
             session["new_achieved"].append("talk-talk-talk")
         if "hedy_honor" not in session["achieved"] and "Hedy" in code:
             session["new_achieved"].append("hedy_honor")
         if "hedy-ious" not in session["achieved"]:
-            all_print_arguments = hedy.all_print_arguments(code, level, session["lang"])
+            if transpile_result is not None:
+                all_print_arguments = transpile_result.print_arguments
+            else:
+                all_print_arguments = hedy.all_print_arguments(code, level, session["lang"])
             for argument in all_print_arguments:
                 if all_print_arguments.count(argument) >= 10:
                     session["new_achieved"].append("hedy-ious")
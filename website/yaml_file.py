@@ -5,11 +5,13 @@ import os
 import pickle
 import re
 import tempfile
+import time
 from . import querylog
 
 from ruamel import yaml
 
-from utils import atomic_write_file
+from bounded_cache import BoundedCache
+from utils import atomic_write_file, is_debug_mode
 from flask import has_request_context, g
 
 yaml_loader = yaml.YAML(typ="safe", pure=True)
@@ -17,6 +19,34 @@ logger = logging.getLogger(__name__)
 
 YAML_FILES_CACHE = {}
 
+# The parsed data of YAML files is kept for the lifetime of the process, up to about this many bytes. The size
+# of the data is estimated from the size of the file. A budget of 0 only caches data for the current request.
+YAML_DATA_CACHE = BoundedCache(max_bytes=int(os.getenv('HEDY_YAML_CACHE_BYTES', 128 * 1024 * 1024)))
+# parsed data takes a little more memory than the file it comes from
+YAML_BYTES_PER_FILE_BYTE = 2
+
+# How many seconds we trust cached data before we check whether the file changed on disk
+YAML_CHECK_INTERVAL = float(os.getenv('HEDY_YAML_CHECK_INTERVAL', 10))
+
+# Data cached in an earlier generation is reloaded the next time it is accessed, see invalidate_yaml_cache()
+YAML_CACHE_GENERATION = 0
+
+
+def invalidate_yaml_cache():
+    """Make all YAML files load again from disk the next time they are accessed."""
+    global YAML_CACHE_GENERATION
+    YAML_CACHE_GENERATION += 1
+
+
+class CachedData:
+    __slots__ = ('data', 'mtime', 'generation', 'checked_at')
+
+    def __init__(self, data, mtime, generation, checked_at):
+        self.data = data
+        self.mtime = mtime
+        self.generation = generation
+        self.checked_at = checked_at
+
 
 class YamlFile:
     """Data from a YAML file, accessible as if it is a dictionary.
@@ -34,12 +64,13 @@ class YamlFile:
     files for a single language in the course of rendering the main code editor page),
     we do some caching work:
 
-    - Caches the loaded data in memory, on the Flask 'current request globals' object.
-      This means that accessing the same file twice in the same request will only load
-      it once. If we don't do this, loading YAMLs takes 2s instead of 1 because of the
-      duplicate loads.
-      - To keep the application memory footprint low, we don't cache the data
-        permanently, but drop it after the request is done.
+    - Caches the loaded data in memory for the lifetime of the process (YAML_DATA_CACHE),
+      under a memory budget. Every YAML_CHECK_INTERVAL seconds we check the timestamp of
+      the file, and load it again if it changed.
+      - The data is shared by all requests, so it must not be changed by its users.
+    - In debug mode, or when the memory budget is 0, we only cache the loaded data on the
+      Flask 'current request globals' object, and drop it after the request is done. This
+      means that accessing the same file twice in the same request will only load it once.
     - After we have successfully loaded a YAML file, we write a pickled version
       of that YAML file to disk, so that we can load the pickled version faster in
       the future future  (loading pickled data is ~400x faster than parsing a YAML
@@ -90,6 +121,26 @@ class YamlFile:
 
         Load it if we haven't loaded it yet or the data on disk changed.
         """
+        if is_debug_mode() or YAML_DATA_CACHE.max_bytes <= 0:
+            return self.access_for_request()
+
+        now = time.monotonic()
+        cached = YAML_DATA_CACHE.get(self.filename)
+        if cached is not None and cached.generation == YAML_CACHE_GENERATION:
+            if now - cached.checked_at < YAML_CHECK_INTERVAL:
+                return cached.data
+            if self._file_timestamp(self.filename) == cached.mtime:
+                cached.checked_at = now
+                return cached.data
+
+        generation = YAML_CACHE_GENERATION
+        mtime = self._file_timestamp(self.filename)
+        data = self.load_dict()
+        YAML_DATA_CACHE.put(self.filename, CachedData(data, mtime, generation, now),
+                            self._file_size() * YAML_BYTES_PER_FILE_BYTE)
+        return data
+
+    def access_for_request(self):
         # Obtain or create a per-request cache dictionary (if we have a request), or an unattached
         # cache object that will disappear after this function returns if we don't have a request.
         yaml_cache = g.setdefault('yaml_cache', {}) if has_request_context() else {}
@@ -97,12 +148,16 @@ class YamlFile:
         if cached is not None:
             return cached
 
+        data = self.load_dict()
+        yaml_cache[self.filename] = data
+        return data
+
+    def load_dict(self):
         data = self.load()
 
         if not isinstance(data, dict):
             raise RuntimeError(f"Contents of {self.filename} needs to be a dict, got: {data}")
 
-        yaml_cache[self.filename] = data
         return data
 
     def load(self):
@@ -112,6 +167,9 @@ class YamlFile:
         and write a pickle file otherwise.
         """
         yaml_ts = self._file_timestamp(self.filename)
+        if yaml_ts is None:
+            # A missing file has no data, even if there is a pickle of it from before it was removed
+            return {}
         pickle_ts = self._file_timestamp(self.pickle_filename)
 
         if pickle_ts and pickle_ts > yaml_ts:
@@ -150,6 +208,12 @@ class YamlFile:
         except FileNotFoundError:
             return None
 
+    def _file_size(self):
+        try:
+            return os.stat(self.filename).st_size
+        except FileNotFoundError:
+            return 0
+
     # Make this object look like a readonly 'dict'
     def __getitem__(self, key):
         return self.access()[key]